@@ -1,6 +1,74 @@
 import math
+import os
 import random
-import copy
+import time
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from search_state import Position
+from rollout import Playout, BatchPlayout
+from transposition import TranspositionTable
+from evaluator import evaluate, get_evaluator
+from bearoff import bearing_off, open_database
+
+ITERATIONS = 1000
+# Root-parallel search forks this many worker processes per AI turn
+WORKERS = int(os.environ.get("MCTS_WORKERS", "1"))
+
+# Search budgets per difficulty, keyed by a player's AI setting. iterations
+# or time_limit (seconds) may be None, but not both.
+SEARCH_BUDGETS = {
+    "Monte": {"iterations": ITERATIONS, "time_limit": 2.0},
+}
+
+# The budget and the early stop are checked every CHECK_EVERY iterations (or
+# every batch). The search stops once the best root child's confidence
+# interval (Z standard errors) no longer overlaps the runner-up's.
+CHECK_EVERY = 50
+MIN_VISITS = 30
+Z = 2.576
+
+# Statistics of every position searched in this process, shared by all games.
+# A position reached again (the same roll from the same spot, a transposition
+# or a repeated opening) starts the new search with its totals. Searches whose
+# rollouts end differently estimate different values, so each configuration
+# (rollout_plies, evaluate, bear-off database) has its own table.
+tables = {}
+
+
+def shared_table(rollout_plies, evaluate, bearoff):
+    """The process-wide table for a search configuration."""
+    if rollout_plies is None:
+        # evaluate only scores rollouts that are cut short
+        evaluate = None
+    config = (rollout_plies, evaluate, bearoff is not None)
+    if config not in tables:
+        tables[config] = TranspositionTable()
+    return tables[config]
+
+
+_pool = None
+_pool_workers = 0
+
+
+def get_pool(workers):
+    """Return the shared process pool, starting it on first use."""
+    global _pool, _pool_workers
+    if _pool is None or _pool_workers < workers:
+        if _pool is not None:
+            _pool.shutdown()
+        _pool = ProcessPoolExecutor(max_workers=workers)
+        _pool_workers = workers
+    return _pool
+
+
+def search_worker(root, states, seed, settings):
+    """Run one independent tree and return {child key: (visits, score)}.
+    settings holds the MCTS arguments shared by every worker."""
+    mcts = MCTS(seed=seed, reuse=False, **settings)
+    mcts.run(root, states)
+    return {
+        key: (child.visits, child.score) for key, child in mcts.root.children.items()
+    }
 
 
 class Dice:
@@ -9,7 +77,7 @@ class Dice:
 
 
 class TreeNode:
-    def __init__(self, game, parent):
+    def __init__(self, game, parent, table=None):
         self.game = game
         if self.game.check_winner():
             self.is_terminal = True
@@ -22,24 +90,167 @@ class TreeNode:
         self.children = {}
         self.root = 0
         self.all_possible_states = []
+        if table is not None and parent is not None:
+            stats = table.get(game.key)
+            if stats is not None:
+                self.visits, self.score = stats
+                parent.visits += self.visits
+                parent.score += self.score
+
+
+def winner_score(winner):
+    if winner == 0:
+        return 1
+    elif winner == 1:
+        return -1
+    return 0
 
 
 class MCTS:
+    def __init__(
+        self,
+        batch_size=None,
+        iterations=ITERATIONS,
+        workers=WORKERS,
+        seed=None,
+        reuse=True,
+        time_limit=None,
+        early_stop=True,
+        rollout_plies=None,
+        evaluate=evaluate,
+        bearoff=True,
+        table=None,
+    ):
+        if iterations is None and time_limit is None:
+            raise ValueError("MCTS needs an iteration count or a time limit")
+        # batch_size runs rollouts in lock-step batches instead of one by one
+        self.batch_size = batch_size
+        self.iterations = iterations
+        self.workers = workers
+        self.seed = seed
+        # Breaks ties between equally good children
+        self.random = random.Random(seed)
+        self.reuse = reuse
+        self.time_limit = time_limit
+        self.early_stop = early_stop
+        # rollout_plies cuts rollouts short and scores them with evaluate
+        self.rollout_plies = rollout_plies
+        if isinstance(evaluate, str):
+            evaluate = get_evaluator(evaluate)
+        self.evaluate = evaluate
+        # Rollouts end with an exact value once both sides are bearing off
+        self.bearoff = open_database() if bearoff else None
+        # reuse seeds new nodes from table, by default the one shared by every
+        # search with the same configuration
+        if not reuse:
+            table = None
+        elif table is None:
+            table = shared_table(rollout_plies, self.evaluate, self.bearoff)
+        self.table = table
+        self.done = 0
+        self.root = None
+
     def search(self, inital_state):
-        self.root = TreeNode(inital_state, None)
-        self.all_possible_states = self.root.game.possible_states()
-        if len(self.all_possible_states) == 1:
-            node = TreeNode(self.all_possible_states.pop(), self.root)
-            return node
-        for i in range(1000):
-            node = self.select(self.root)
-            score = self.rollout(node.game)
-            self.backpropagate(node, score)
+        root = Position.from_game(inital_state)
+        states = list(inital_state.possible_states())
+        if len(states) == 1:
+            return TreeNode(states[0], TreeNode(root, None))
+        if self.workers > 1:
+            self.parallel_run(root, states)
+        else:
+            self.run(root, states)
+        return self.best_move()
+
+    def best_move(self):
+        """Best root child found so far, or None before the first iteration."""
         try:
             return self.get_best_move(self.root, 0)
         except:
             pass
 
+    def run(self, root, states):
+        """Search from root, whose children are the given states."""
+        stop = self.bearoff is not None
+        self.playout = Playout(self.seed, stop_at_bearoff=stop)
+        self.batch_playout = BatchPlayout(self.seed, stop_at_bearoff=stop)
+        self.root = TreeNode(root, None)
+        self.all_possible_states = list(states)
+        self.done = 0
+        if self.time_limit is not None:
+            deadline = time.perf_counter() + self.time_limit
+        while self.iterations is None or self.done < self.iterations:
+            count = self.batch_size or CHECK_EVERY
+            if self.iterations is not None:
+                count = min(count, self.iterations - self.done)
+            if self.batch_size:
+                self.batched_iterations(count)
+            else:
+                for i in range(count):
+                    node = self.select(self.root)
+                    score = self.rollout(node.game)
+                    self.backpropagate(node, score)
+            self.done += count
+            if self.time_limit is not None and time.perf_counter() >= deadline:
+                break
+            if self.early_stop and self.separated(self.root):
+                break
+
+    def separated(self, node):
+        """True once the leading child is clearly better than the runner-up."""
+        if not node.is_fully_expanded or len(node.children) < 2:
+            return False
+        bounds = []
+        for child in node.children.values():
+            if child.visits < MIN_VISITS:
+                return False
+            # Scores are White's; the mover is the side not to move in child
+            mean = child.score / child.visits
+            if child.game.turn == 0:
+                mean = -mean
+            error = Z * math.sqrt(max(1 - mean * mean, 0) / child.visits)
+            bounds.append((mean, mean - error, mean + error))
+        bounds.sort(reverse=True)
+        # A less visited child can trail on the mean with a wider interval
+        return bounds[0][1] > max(upper for _, _, upper in bounds[1:])
+
+    def parallel_run(self, root, states):
+        """Split the iterations over independent trees in worker processes and
+        merge their per-child statistics into self.root."""
+        pool = get_pool(self.workers)
+        settings = {
+            "batch_size": self.batch_size,
+            "iterations": self.iterations and -(-self.iterations // self.workers),
+            "time_limit": self.time_limit,
+            "early_stop": self.early_stop,
+            "rollout_plies": self.rollout_plies,
+            "bearoff": self.bearoff is not None,
+            "evaluate": self.evaluate,
+        }
+        seeds = random.Random(self.seed).sample(range(2**32), self.workers)
+        futures = [
+            pool.submit(search_worker, root, states, seed, settings) for seed in seeds
+        ]
+        self.done = 0
+        merged = {}
+        for future in futures:
+            for key, (visits, score) in future.result().items():
+                total = merged.setdefault(key, [0, 0])
+                total[0] += visits
+                total[1] += score
+                self.done += visits
+        self.root = TreeNode(root, None)
+        for state in states:
+            child = TreeNode(state, self.root, self.table)
+            visits, score = merged.get(state.key, (0, 0))
+            child.visits += visits
+            child.score += score
+            self.root.visits += visits
+            self.root.score += score
+            if child.visits:
+                self.root.children[state.key] = child
+                self.record(child)
+        self.root.is_fully_expanded = len(self.root.children) == len(states)
+
     def select(self, node):
         while not node.is_terminal:
             if node.is_fully_expanded:
@@ -49,56 +260,76 @@ class MCTS:
 
     def expand(self, node):
         state = self.all_possible_states.pop()
-        new_node = TreeNode(state, node)
-        node.children[hash(state)] = new_node
+        new_node = TreeNode(state, node, self.table)
+        node.children[state.key] = new_node
         if len(self.all_possible_states) == 0:
             node.is_fully_expanded = True
         return new_node
 
-    def rollout(self, game):
-        the_board = game.game_board.board.copy()
-        the_rolls = game.rolls
-        the_current_turn = game.current_turn
-        white_player_dead = game.players[0].num_dead_pieces
-        white_player_home = game.players[0].num_home_pieces
-        black_player_dead = game.players[1].num_dead_pieces
-        black_player_home = game.players[1].num_home_pieces
-        white_player_type = game.players[0].AI
-        black_player_type = game.players[1].AI
-
-        game.players[0].AI = "Random"
-        game.players[1].AI = "Random"
-        game.real_game = False
-        game.start_game()
-        game.game_board.board = the_board
-        game.current_turn = the_current_turn
-        game.players[0].num_dead_pieces = white_player_dead
-        game.players[0].num_home_pieces = white_player_home
-        game.players[1].num_dead_pieces = black_player_dead
-        game.players[1].num_home_pieces = black_player_home
-        game.players[0].AI = white_player_type
-        game.players[1].AI = black_player_type
-        game.rolls = the_rolls
-        game.real_game = True
-        if game.current_turn == 0:
-            return 1
-        elif game.current_turn == 1:
-            return -1
+    def rollout(self, position):
+        winner = self.playout.play(position, self.rollout_plies)
+        if winner is None:
+            cells = self.playout.cells
+            if self.bearoff is not None and self.playout.bearing_off(cells):
+                return self.bearoff.value(cells)
+            if self.rollout_plies is not None:
+                return float(self.evaluate(cells)[0])
+        return winner_score(winner)
+
+    def batched_iterations(self, iterations):
+        done = 0
+        while done < iterations:
+            nodes = []
+            for i in range(min(self.batch_size, iterations - done)):
+                node = self.select(self.root)
+                # Count the visit now so the rest of the batch spreads out
+                self.backpropagate(node, 0)
+                nodes.append(node)
+            winners = self.batch_playout.play(
+                [node.game for node in nodes], self.rollout_plies
+            )
+            scores = [winner_score(winner) for winner in winners]
+            if (winners < 0).any():
+                cells = self.batch_playout.cells
+                values = np.zeros(len(cells))
+                if self.rollout_plies is not None:
+                    values = self.evaluate(cells)
+                if self.bearoff is not None:
+                    home = bearing_off(cells)
+                    if home.any():
+                        values[home] = self.bearoff.values(cells[home])
+                scores = [
+                    float(value) if winner < 0 else score
+                    for winner, value, score in zip(winners, values, scores)
+                ]
+            for node, score in zip(nodes, scores):
+                while node is not None:
+                    node.score += score
+                    self.record(node)
+                    node = node.parent
+            done += len(nodes)
 
     def backpropagate(self, node, score):
         while node is not None:
             node.visits += 1
             node.score += score
+            self.record(node)
             node = node.parent
 
+    def record(self, node):
+        """Write a node's totals to the transposition table. The root is left
+        out: its totals include whatever its children were seeded with."""
+        if self.table is not None and node.parent is not None:
+            self.table.store(node.game.key, node.visits, node.score)
+
     def get_best_move(self, node, explore_constant):
         best_score = float("-inf")
         best_moves = []
 
         for child_node in node.children.values():
-            if child_node.game.current_turn == 0:
+            if child_node.game.turn == 1:
                 current_player = 1
-            elif child_node.game.current_turn == 1:
+            elif child_node.game.turn == 0:
                 current_player = -1
             move_score = (
                 current_player * child_node.score / child_node.visits
@@ -111,4 +342,4 @@ class MCTS:
             elif move_score == best_score:
                 best_moves.append(child_node)
 
-        return random.choice(best_moves)
+        return self.random.choice(best_moves)
@@ -1,8 +1,12 @@
 import random
 import numpy as np
-import copy
 import json
 from MCTS import *
+from search_state import Position, CELL_KEYS, TURN, cells_key
+from move_generator import legal_plays
+from expectiminimax import Expectiminimax, PLY_BUDGETS
+from race import Race
+from opening_book import open_book
 
 
 class Checker:
@@ -59,18 +63,110 @@ class Player:
         return player
 
 
+def build_move_table():
+    # MOVE_TABLE[color][start][roll] is where a checker from start lands with
+    # roll: a point (0-23), the exact bear-off (26 White, 27 Black), -1 for a
+    # bear-off that overshoots, or -2 when start is the other side's bar.
+    table = [[[-2] * 7 for start in range(26)] for color in range(2)]
+    for roll in range(1, 7):
+        for start in range(24):
+            white_end = start - roll
+            table[0][start][roll] = (
+                white_end if white_end >= 0 else 26 if white_end == -1 else -1
+            )
+            black_end = start + roll
+            table[1][start][roll] = (
+                black_end if black_end <= 23 else 27 if black_end == 24 else -1
+            )
+        table[0][24][roll] = 24 - roll
+        table[1][25][roll] = roll - 1
+    return table
+
+
+MOVE_TABLE = build_move_table()
+POINTS_MASK = (1 << 24) - 1
+
+
+def checker_location(column, height):
+    """UI (x, y) of the checker height places from the edge of a column (a
+    point, 24/25 the White/Black bar, 26/27 White/Black off), as
+    update_locations places checkers."""
+    if column == 24:
+        return 94.1, 45 - 10 * (height + 1)
+    if column == 25:
+        return 94.1, 45 + 10 * (height + 1)
+    if column == 26:
+        return 0, height * 2.2
+    if column == 27:
+        return 0, 98 - height * 2.2
+    if column <= 5:
+        return 9.2 + 6.67 * column, height * 8
+    if column <= 11:
+        return 9.2 + 6.67 * column + 2.98, height * 8
+    if column <= 17:
+        return 85.55 - 6.67 * (column % 12), 92 - height * 8
+    return 85.55 - 6.67 * (column % 12) - 2.98, 92 - height * 8
+
+
+def replay_snapshots(snapshots):
+    """The move log (start, end, die, hit) that steps through a list of
+    (cells, rolls, turn) snapshots, where cells are the 24 points then the
+    bar and off counts. None if two snapshots in a row are not one move
+    apart."""
+    moves = []
+    for (before, rolls, turn), (after, next_rolls, next_turn) in zip(
+        snapshots, snapshots[1:]
+    ):
+        if turn != next_turn:
+            return None
+        sign = -1 if turn == 0 else 1
+        # The mover's checkers per point, then on its bar and borne off
+        own = [
+            [max(sign * count, 0) for count in cells[:24]]
+            + [cells[24 + turn], cells[26 + turn]]
+            for cells in (before, after)
+        ]
+        delta = [new - old for old, new in zip(*own)]
+        if sorted(delta) != [-1] + [0] * 24 + [1]:
+            return None
+        start = delta.index(-1)
+        end = delta.index(1)
+        if start == 25:
+            return None
+        dice = list(rolls)
+        for roll in next_rolls:
+            if roll not in dice:
+                return None
+            dice.remove(roll)
+        if len(dice) != 1:
+            return None
+        hit = after[25 - turn] == before[25 - turn] + 1
+        start = 24 + turn if start == 24 else start
+        end = 26 + turn if end == 25 else end
+        moves.append((start, end, dice[0], hit))
+    return moves
+
+
 class Board:
     def __init__(self):
         self.board = np.zeros(24, dtype=int)
         self.setup_starting_positions()
+        self.recount()
 
     def to_dict(self):
         return {"board": self.board.tolist()}
 
     @classmethod
     def from_dict(cls, data):
-        board = cls()
-        board.board = np.array(data["board"], dtype=int)
+        return cls.from_points(data["board"])
+
+    @classmethod
+    def from_points(cls, points):
+        """A board with the 24 point counts given, without the starting
+        position the constructor sets up first."""
+        board = cls.__new__(cls)
+        board.board = np.array(points, dtype=int)
+        board.recount()
         return board
 
     def __str__(self):
@@ -95,6 +191,43 @@ class Board:
         self.board[18] = 5
         self.board[23] = -2
 
+    def recount(self):
+        # Per color (0 White, 1 Black): points it occupies, points it cannot
+        # land on, and how many of its checkers are outside its home board.
+        cells = self.board.tolist()
+        self.occupied = [0, 0]
+        self.blocked = [0, 0]
+        for point, count in enumerate(cells):
+            if count < 0:
+                self.occupied[0] |= 1 << point
+                if count <= -2:
+                    self.blocked[1] |= 1 << point
+            elif count > 0:
+                self.occupied[1] |= 1 << point
+                if count >= 2:
+                    self.blocked[0] |= 1 << point
+        self.outside_home = [
+            sum(-count for count in cells[6:] if count < 0),
+            sum(count for count in cells[:18] if count > 0),
+        ]
+
+    def add(self, point, delta):
+        old = int(self.board[point])
+        self.board[point] = old + delta
+        self.update_counters(point, old, old + delta)
+
+    def update_counters(self, point, old, new):
+        bit = 1 << point
+        clear = ~bit
+        self.occupied[0] = self.occupied[0] & clear | (bit if new < 0 else 0)
+        self.occupied[1] = self.occupied[1] & clear | (bit if new > 0 else 0)
+        self.blocked[0] = self.blocked[0] & clear | (bit if new >= 2 else 0)
+        self.blocked[1] = self.blocked[1] & clear | (bit if new <= -2 else 0)
+        if point >= 6:
+            self.outside_home[0] += max(-new, 0) - max(-old, 0)
+        if point <= 17:
+            self.outside_home[1] += max(new, 0) - max(old, 0)
+
     def within_board(self, start):
         if 0 <= start <= 23:
             return True
@@ -104,99 +237,88 @@ class Board:
         if player.num_dead_pieces > 0:
             return False
         if player.color == "White":
-            for i in range(6, 24):
-                if self.board[i] < 0:
-                    return False
-        elif player.color == "Black":
-            for i in range(0, 18):
-                if self.board[i] > 0:
-                    return False
-        return True
+            return self.outside_home[0] == 0
+        return self.outside_home[1] == 0
+
+    def is_contact(self, players):
+        """True while a checker of one side can still hit the other."""
+        white_bar = players[0].num_dead_pieces
+        black_bar = players[1].num_dead_pieces
+        white, black = self.occupied
+        if not (white or white_bar) or not (black or black_bar):
+            return False
+        if white_bar or black_bar:
+            return True
+        # White moves down the board and Black up, so they have passed each
+        # other once White's furthest-back checker is below Black's.
+        return white.bit_length() > (black & -black).bit_length()
 
     def largest_in_home(self, player):
         if player.color == "White":
-            for i in range(5, -1, -1):
-                if self.board[i] < 0:
-                    return i
+            home = self.occupied[0] & 0x3F
+            if home:
+                return home.bit_length() - 1
         elif player.color == "Black":
-            for i in range(18, 24):
-                if self.board[i] > 0:
-                    return i
+            home = self.occupied[1] >> 18
+            if home:
+                return (home & -home).bit_length() + 17
         return None
 
     def possible_starts(self, rolls, player):
-        possible_starts = []
-        for start in range(24):
-            possible = []
-            if player.color == "White":
-                if self.board[start] < 0:
-                    possible = self.possible_moves(start, rolls, player)
+        color = 0 if player.color == "White" else 1
+        if player.num_dead_pieces > 0:
+            if self.possible_moves(player.dead_position, rolls, player):
+                return [player.dead_position]
+            return []
+        occupied = self.occupied[color]
+        blocked = self.blocked[color]
+        starts = 0
+        for roll in set(rolls):
+            if color == 0:
+                starts |= occupied & ~(blocked << roll) & ~((1 << roll) - 1)
             else:
-                if self.board[start] > 0:
-                    possible = self.possible_moves(start, rolls, player)
-            if len(possible) != 0:
-                possible_starts.append(start)
-        if possible_starts == []:
-            possible = self.possible_moves(24, rolls, player)
-            if len(possible) != 0:
-                possible_starts.append(24)
-            possible2 = self.possible_moves(25, rolls, player)
-            if len(possible2) != 0:
-                possible_starts.append(25)
+                starts |= occupied & ~(blocked >> roll) & (POINTS_MASK >> roll)
+        largest = self.largest_in_home(player)
+        if largest is not None and self.can_player_bear_off(player):
+            for roll in rolls:
+                if color == 0:
+                    starts |= occupied & (1 << (roll - 1))
+                    if largest < roll:
+                        starts |= 1 << largest
+                else:
+                    starts |= occupied & (1 << (24 - roll))
+                    if largest + roll > 23:
+                        starts |= 1 << largest
+        possible_starts = []
+        while starts:
+            lowest = starts & -starts
+            possible_starts.append(lowest.bit_length() - 1)
+            starts ^= lowest
         return possible_starts
 
     def possible_moves(self, start, rolls, player):
         possible_col_to_roll = {}
-        if player.color == "White":
-            if self.within_board(start) and self.can_player_bear_off(player):
-                largest = self.largest_in_home(player)
-                if largest is None:
-                    largest = 1000
-                for roll in rolls:
-                    if (
-                        start - roll >= 0
-                        and self.board[start - roll] <= 1
-                        and self.board[start] < 0
-                    ):
-                        possible_col_to_roll[start - roll] = roll
-                    if start >= largest and start - roll < 0 and self.board[start] < 0:
-                        possible_col_to_roll[26] = roll
-                    if self.board[start] < 0 and roll - 1 == start:
-                        possible_col_to_roll[26] = roll
-            elif self.within_board(start) and player.num_dead_pieces == 0:
-                if self.board[start] < 0:
-                    for roll in rolls:
-                        if start - roll >= 0 and self.board[start - roll] <= 1:
-                            possible_col_to_roll[start - roll] = roll
-            elif start == 24 and player.num_dead_pieces > 0:
-                for roll in rolls:
-                    if self.board[24 - roll] <= 1:
-                        possible_col_to_roll[24 - roll] = roll
-        elif player.color == "Black":
-            if self.within_board(start) and self.can_player_bear_off(player):
-                largest = self.largest_in_home(player)
-                if largest is None:
-                    largest = -1000
-                for roll in rolls:
-                    if (
-                        start + roll <= 23
-                        and self.board[start + roll] >= -1
-                        and self.board[start] > 0
-                    ):
-                        possible_col_to_roll[start + roll] = roll
-                    if start <= largest and start + roll > 23 and self.board[start] > 0:
-                        possible_col_to_roll[27] = roll
-                    if self.board[start] > 0 and 24 - roll == start:
-                        possible_col_to_roll[27] = roll
-            elif self.within_board(start) and player.num_dead_pieces == 0:
-                if self.board[start] > 0:
-                    for roll in rolls:
-                        if start + roll <= 23 and self.board[start + roll] >= -1:
-                            possible_col_to_roll[start + roll] = roll
-            elif start == 25 and player.num_dead_pieces > 0:
-                for roll in rolls:
-                    if self.board[roll - 1] >= -1:
-                        possible_col_to_roll[roll - 1] = roll
+        color = 0 if player.color == "White" else 1
+        if player.num_dead_pieces > 0:
+            if start != player.dead_position:
+                return possible_col_to_roll
+            bear_off = False
+        elif not (self.within_board(start) and self.occupied[color] >> start & 1):
+            return possible_col_to_roll
+        else:
+            bear_off = self.outside_home[color] == 0
+        targets = MOVE_TABLE[color][start]
+        blocked = self.blocked[color]
+        for roll in rolls:
+            end = targets[roll]
+            if end >= 24:
+                if bear_off:
+                    possible_col_to_roll[end] = roll
+            elif end >= 0:
+                if not blocked >> end & 1:
+                    possible_col_to_roll[end] = roll
+            elif bear_off and start == self.largest_in_home(player):
+                possible_col_to_roll[player.home_position] = roll
         return possible_col_to_roll
 
 
@@ -285,7 +407,8 @@ class Backgammon:
             27: [],
         }
         self.state_hash_to_move = {}
-        self.save_state()
+        self.rehash()
+        self.start_history()
 
     def to_json(self):
         """Serialize the game state to a JSON-compatible dictionary."""
@@ -295,21 +418,9 @@ class Backgammon:
                 "game_board": self.game_board.to_dict(),
                 "current_turn": self.current_turn,
                 "rolls": self.rolls,
-                "history": [
-                    {
-                        "Board": state["Board"].to_dict(),
-                        "Players": [player.to_dict() for player in state["Players"]],
-                        "Current_turn": state["Current_turn"],
-                        "Rolls": state["Rolls"],
-                        "Columns": state["Columns"],
-                        "Checkers": [
-                            checker.to_dict() for checker in state["Checkers"]
-                        ],
-                        "Message": state["Message"],
-                    }
-                    for state in self.history
-                ],
+                "history": [list(move) for move in self.history],
                 "history_pointer": self.history_pointer,
+                "history_rolls": self.history_rolls,
                 "real_game": self.real_game,
                 "end_of_turn": self.end_of_turn,
                 "num_restarts": self.num_restarts,
@@ -319,52 +430,52 @@ class Backgammon:
             }
         )
 
+    @classmethod
+    def blank(cls, players):
+        """A game for players with nothing else set, for loaders to fill in.
+        It skips the constructor, which rolls for the first turn, sets up
+        the starting position and checkers, and starts the undo log."""
+        game = cls.__new__(cls)
+        game.name1, game.name2 = players[0].name, players[1].name
+        game.AI1, game.AI2 = players[0].AI, players[1].AI
+        game.players = players
+        game.state_hash_to_move = {}
+        return game
+
     @classmethod
     def from_json(cls, json_data):
         """Deserialize the JSON data back into a Backgammon object."""
         data = json.loads(json_data)
-        players = [Player.from_dict(p) for p in data["players"]]
-        game = cls(
-            name1=players[0].name,
-            name2=players[1].name,
-            AI1=players[0].AI,
-            AI2=players[1].AI,
-        )
-        game.players[0].color = players[0].color
-        game.players[1].color = players[1].color
-        game.players[0].home_position = players[0].home_position
-        game.players[1].home_position = players[1].home_position
-        game.players[0].dead_position = players[0].dead_position
-        game.players[1].dead_position = players[1].dead_position
-        game.players[0].num_home_pieces = players[0].num_home_pieces
-        game.players[1].num_home_pieces = players[1].num_home_pieces
-        game.players[0].num_dead_pieces = players[0].num_dead_pieces
-        game.players[1].num_dead_pieces = players[1].num_dead_pieces
-
+        game = cls.blank([Player.from_dict(p) for p in data["players"]])
         game.game_board = Board.from_dict(data["game_board"])
         game.current_turn = data["current_turn"]
         game.rolls = data["rolls"]
-        game.history = [
-            {
-                "Board": Board.from_dict(state["Board"]),
-                "Players": [Player.from_dict(player) for player in state["Players"]],
-                "Current_turn": state["Current_turn"],
-                "Rolls": state["Rolls"],
-                "Columns": state["Columns"],
-                "Checkers": [
-                    Checker.from_dict(checker) for checker in state["Checkers"]
+        if "history_rolls" in data:
+            game.history = [tuple(move) for move in data["history"]]
+            game.history_pointer = data["history_pointer"]
+            game.history_rolls = data["history_rolls"]
+        else:
+            # Saved when undo kept a full snapshot after every move
+            game.adopt_snapshots(
+                [
+                    (
+                        state["Board"]["board"]
+                        + [player["num_dead_pieces"] for player in state["Players"]]
+                        + [player["num_home_pieces"] for player in state["Players"]],
+                        state["Rolls"],
+                        state["Current_turn"],
+                    )
+                    for state in data["history"]
                 ],
-                "Message": state["Message"],
-            }
-            for state in data["history"]
-        ]
-        game.history_pointer = data["history_pointer"]
+                data["history_pointer"],
+            )
         game.real_game = data["real_game"]
         game.end_of_turn = data["end_of_turn"]
         game.num_restarts = data["num_restarts"]
         game.message = data["message"]
         game.checkers = [Checker.from_dict(c) for c in data["checkers"]]
         game.columns = {int(key): value for key, value in data["columns"].items()}
+        game.rehash()
         return game
 
     def update_locations(self, start, end):
@@ -482,8 +593,31 @@ class Backgammon:
         game.rolls = rolls
         return game
 
+    def add_to_cell(self, cell, delta):
+        """Change a point, bar (24/25) or off (26/27) count and update board_key."""
+        if cell < 24:
+            old = int(self.game_board.board[cell])
+            self.game_board.add(cell, delta)
+        elif cell < 26:
+            player = self.players[cell - 24]
+            old = player.num_dead_pieces
+            player.num_dead_pieces = old + delta
+        else:
+            player = self.players[cell - 26]
+            old = player.num_home_pieces
+            player.num_home_pieces = old + delta
+        keys = CELL_KEYS[cell]
+        self.board_key ^= keys[old + 15] ^ keys[old + delta + 15]
+
+    def rehash(self):
+        self.board_key = cells_key(
+            self.game_board.board.tolist()
+            + [player.num_dead_pieces for player in self.players]
+            + [player.num_home_pieces for player in self.players]
+        )
+
     def __hash__(self):
-        return hash(tuple(self.game_board.board))
+        return self.board_key ^ CELL_KEYS[TURN][self.current_turn + 15]
 
     def __str__(self):
         player_info = f"White: {self.players[0].name} | Black: {self.players[1].name}\n"
@@ -503,106 +637,97 @@ class Backgammon:
             and self.rolls == other.rolls
         )
 
-    def save_state(self):
-        state = {
-            "Board": copy.deepcopy(self.game_board),
-            "Players": copy.deepcopy(self.players),
-            "Current_turn": copy.deepcopy(self.current_turn),
-            "Rolls": copy.deepcopy(self.rolls),
-            "Columns": copy.deepcopy(self.columns),
-            "Checkers": [copy.deepcopy(checker) for checker in self.checkers],
-            "Message": copy.deepcopy(self.message),
-        }
+    def start_history(self):
+        """Start an empty undo log from the current position and rolls."""
+        self.history = []
+        self.history_pointer = -1
+        self.history_rolls = self.rolls[:]
+
+    def log_move(self, record):
+        start, end, roll, roll_index, hit, end_of_turn = record
         if self.history_pointer < len(self.history) - 1:
             self.history = self.history[: self.history_pointer + 1]
-        self.history.append(state)
+        self.history.append((start, end, roll, hit))
         self.history_pointer += 1
 
-    def load_state(self, state):
-        self.game_board = copy.deepcopy(state["Board"])
-        self.players = copy.deepcopy(state["Players"])
-        self.current_turn = copy.deepcopy(state["Current_turn"])
-        self.rolls = copy.deepcopy(state["Rolls"])
-        self.columns = copy.deepcopy(state["Columns"])
-        self.checkers = [copy.deepcopy(checker) for checker in state["Checkers"]]
-        self.message = copy.deepcopy(state["Message"])
+    def adopt_snapshots(self, snapshots, pointer):
+        """Replace (cells, rolls, turn) undo snapshots, as older saves kept
+        them, with the equivalent move log. Without one, the log starts over."""
+        moves = replay_snapshots(snapshots)
+        if not snapshots or moves is None:
+            self.start_history()
+            return
+        self.history = moves
+        self.history_pointer = max(pointer - 1, -1)
+        self.history_rolls = list(snapshots[0][1])
+
+    def rolls_after(self, pointer):
+        """The rolls left after the logged moves up to pointer."""
+        rolls = self.history_rolls[:]
+        for start, end, roll, hit in self.history[: pointer + 1]:
+            rolls.remove(roll)
+        return rolls
+
+    def layout_checkers(self):
+        """Rebuild columns and the UI checker positions from the board,
+        moving as few checkers between columns as possible."""
+        board = self.game_board.board.tolist()
+        # (Black?, count) per column; checkers 0-14 are Black
+        wanted = [(count > 0, abs(count)) for count in board] + [
+            (False, self.players[0].num_dead_pieces),
+            (True, self.players[1].num_dead_pieces),
+            (False, self.players[0].num_home_pieces),
+            (True, self.players[1].num_home_pieces),
+        ]
+        spare = {True: [], False: []}
+        for column, (black, count) in enumerate(wanted):
+            kept = []
+            for index in self.columns[column]:
+                is_black = self.checkers[index].id <= 14
+                if is_black == black and len(kept) < count:
+                    kept.append(index)
+                else:
+                    spare[is_black].append(index)
+            self.columns[column] = kept
+        for column, (black, count) in enumerate(wanted):
+            stack = self.columns[column]
+            while len(stack) < count:
+                stack.append(spare[black].pop())
+            for height, index in enumerate(stack):
+                checker = self.checkers[index]
+                checker.x, checker.y = checker_location(column, height)
 
     def undo(self):
-        if self.history_pointer >= 1:
-            self.history_pointer -= 1
-            previous_state = self.history[self.history_pointer]
-            self.load_state(previous_state)
-            return True
-        return False
+        if self.history_pointer < 0:
+            return False
+        start, end, roll, hit = self.history[self.history_pointer]
+        self.history_pointer -= 1
+        self.undo_move((start, end, roll, 0, hit, False))
+        self.rolls = self.rolls_after(self.history_pointer)
+        self.layout_checkers()
+        return True
 
     def redo(self):
-        if self.history_pointer < len(self.history) - 1:
-            self.history_pointer += 1
-            next_state = self.history[self.history_pointer]
-            self.load_state(next_state)
-            return True
-        return False
+        if self.history_pointer >= len(self.history) - 1:
+            return False
+        start, end, roll, hit = self.history[self.history_pointer + 1]
+        self.rolls = self.rolls_after(self.history_pointer)
+        self.history_pointer += 1
+        self.apply_move(start, end, {end: roll})
+        self.layout_checkers()
+        return True
 
     def change_turn(self):
         print(f"Rolls: {self.rolls}, End of Turn: {self.end_of_turn}")
         if self.rolls == [] and self.end_of_turn:
             self.current_turn = (self.current_turn + 1) % 2
             self.end_of_turn = False
-            self.history = []
-            self.history_pointer = -1
+            self.start_history()
 
     def possible_states(self):
-        temporary = copy.deepcopy(self)
-        i = 0
-        possible_states_1 = set()
-        possible_states_2 = set()
-        possible_states_1_dict = {}
-        possible_states_2_dict = {}
-        possible_starts = temporary.game_board.possible_starts(
-            temporary.rolls, temporary.players[temporary.current_turn]
-        )
-        if len(temporary.rolls) == 2:
-            for start in possible_starts:
-                possible_moves = temporary.game_board.possible_moves(
-                    start, temporary.rolls, temporary.players[temporary.current_turn]
-                )
-                for end in possible_moves:
-                    temp_game = copy.deepcopy(temporary)
-                    temp_game.make_move(start, end, possible_moves)
-                    move = (start, end)
-                    temp_game_hash = hash(temp_game)
-                    if temp_game_hash not in possible_states_1_dict:
-                        possible_states_1.add(temp_game)
-                        possible_states_1_dict[temp_game_hash] = move
-                    new_possible_starts = temp_game.game_board.possible_starts(
-                        temp_game.rolls, temp_game.players[temp_game.current_turn]
-                    )
-                    for new_start in new_possible_starts:
-                        new_possible_moves = temp_game.game_board.possible_moves(
-                            new_start,
-                            temp_game.rolls,
-                            temp_game.players[temp_game.current_turn],
-                        )
-                        for new_end in new_possible_moves:
-                            done_state = copy.deepcopy(temp_game)
-                            done_state.make_move(new_start, new_end, new_possible_moves)
-                            new_move = (new_start, new_end)
-                            i += 1
-                            done_state_hash = hash(done_state)
-                            if done_state_hash not in possible_states_2_dict:
-                                possible_states_2.add(done_state)
-                                possible_states_2_dict[done_state_hash] = (
-                                    move,
-                                    new_move,
-                                )
-            if possible_states_2:
-                self.state_hash_to_move = possible_states_2_dict
-                return possible_states_2
-            elif possible_states_1:
-                self.state_hash_to_move = possible_states_1_dict
-                return possible_states_1
-        self.state_hash_to_move[hash(temporary)] = ()
-        return [temporary]
+        plays = legal_plays(Position.from_game(self), self.rolls)
+        self.state_hash_to_move = {state.key: moves for state, moves in plays}
+        return [state for state, _ in plays]
 
     def determine_first_turn(self):
         while True:
@@ -643,53 +768,55 @@ class Backgammon:
             print(self.rolls)
         return
 
-    def make_move(self, start, end, possible):
-        self.rolls.remove(possible[end])
-        if self.current_turn == 0:
-            if self.players[0].num_dead_pieces > 0:
-                if self.game_board.board[end] == 1:
-                    self.players[0].num_dead_pieces -= 1
-                    self.game_board.board[end] -= 2
-                    self.players[1].num_dead_pieces += 1
-                else:
-                    self.players[0].num_dead_pieces -= 1
-                    self.game_board.board[end] -= 1
-            elif end == 26:
-                self.game_board.board[start] += 1
-                self.players[0].num_home_pieces += 1
-            else:
-                if self.game_board.board[end] == 1:
-                    self.game_board.board[start] += 1
-                    self.game_board.board[end] -= 2
-                    self.players[1].num_dead_pieces += 1
-                else:
-                    self.game_board.board[start] += 1
-                    self.game_board.board[end] -= 1
+    def apply_move(self, start, end, possible):
+        """Make a move on the board only and return a record for undo_move."""
+        roll = possible[end]
+        roll_index = self.rolls.index(roll)
+        del self.rolls[roll_index]
+        player = self.players[self.current_turn]
+        sign = -1 if self.current_turn == 0 else 1
+        hit = False
+        if player.num_dead_pieces > 0:
+            start = player.dead_position
+            self.add_to_cell(start, -1)
         else:
-            if self.players[1].num_dead_pieces > 0:
-                if self.game_board.board[end] == -1:
-                    self.players[1].num_dead_pieces -= 1
-                    self.game_board.board[end] += 2
-                    self.players[0].num_dead_pieces += 1
-                else:
-                    self.players[1].num_dead_pieces -= 1
-                    self.game_board.board[end] += 1
-            elif end == 27:
-                self.game_board.board[start] -= 1
-                self.players[1].num_home_pieces += 1
-            else:
-                if self.game_board.board[end] == -1:
-                    self.game_board.board[start] -= 1
-                    self.game_board.board[end] += 2
-                    self.players[0].num_dead_pieces += 1
-                else:
-                    self.game_board.board[start] -= 1
-                    self.game_board.board[end] += 1
+            self.add_to_cell(start, -sign)
+        if end == player.home_position:
+            self.add_to_cell(end, 1)
+        elif self.game_board.board[end] == -sign:
+            self.add_to_cell(end, 2 * sign)
+            self.add_to_cell(self.players[1 - self.current_turn].dead_position, 1)
+            hit = True
+        else:
+            self.add_to_cell(end, sign)
+        end_of_turn = self.end_of_turn
         if self.rolls == []:
             self.end_of_turn = True
+        return (start, end, roll, roll_index, hit, end_of_turn)
+
+    def undo_move(self, record):
+        start, end, roll, roll_index, hit, end_of_turn = record
+        player = self.players[self.current_turn]
+        sign = -1 if self.current_turn == 0 else 1
+        if end == player.home_position:
+            self.add_to_cell(end, -1)
+        elif hit:
+            self.add_to_cell(end, -2 * sign)
+            self.add_to_cell(self.players[1 - self.current_turn].dead_position, -1)
+        else:
+            self.add_to_cell(end, -sign)
+        if start == player.dead_position:
+            self.add_to_cell(start, 1)
+        else:
+            self.add_to_cell(start, sign)
+        self.rolls.insert(roll_index, roll)
+        self.end_of_turn = end_of_turn
+
+    def make_move(self, start, end, possible):
+        record = self.apply_move(start, end, possible)
         if self.real_game:
             self.update_locations(start, end)
-            self.save_state()
+            self.log_move(record)
 
     def pick_start(self, start):
         possible = self.game_board.possible_moves(
@@ -698,44 +825,22 @@ class Backgammon:
         self.message = possible
 
     def ai_play(self):
-        the_rolls = self.rolls
-        if len(the_rolls) == 4:
-            mcts = MCTS()
-            self.rolls = the_rolls[0:2]
-            best_move = mcts.search(self)
-            self.game_board = best_move.game.game_board
-            self.players = best_move.game.players
-            self.rolls = the_rolls[2:4]
-            moves = self.state_hash_to_move[hash(best_move.game)]
-            if len(moves) == 0:
-                self.end_of_turn = False
-                self.rolls = []
-                return
-            if isinstance(moves[0], tuple):
-                for move_pair in moves:
-                    start, end = move_pair
-                    self.update_locations(start, end)
+        ai = self.players[self.current_turn].AI
+        book = open_book()
+        best_move = book.choose(self) if book is not None else None
+        if best_move is None:
+            if not self.game_board.is_contact(self.players):
+                engine = Race()
+            elif ai in PLY_BUDGETS:
+                engine = Expectiminimax(**PLY_BUDGETS[ai])
             else:
-                start, end = moves
-                self.update_locations(start, end)
-        mcts = MCTS()
-        best_move = mcts.search(self)
-        self.game_board = best_move.game.game_board
-        self.players = best_move.game.players
-        self.rolls = best_move.game.rolls
-        moves = self.state_hash_to_move[hash(best_move.game)]
+                engine = MCTS(**SEARCH_BUDGETS.get(ai, {}))
+            best_move = engine.search(self)
+        moves = self.state_hash_to_move[best_move.game.key]
+        best_move.game.write_to(self)
         self.end_of_turn = False
         self.rolls = []
-        if len(moves) == 0:
-            self.end_of_turn = False
-            self.rolls = []
-            return
-        if isinstance(moves[0], tuple):
-            for move_pair in moves:
-                start, end = move_pair
-                self.update_locations(start, end)
-        else:
-            start, end = moves
+        for start, end in moves:
             self.update_locations(start, end)
         return
 
@@ -837,7 +942,8 @@ class Backgammon:
             26: [],
             27: [],
         }
-        self.save_state()
+        self.rehash()
+        self.start_history()
 
     def main_loop(self):
         while True:
@@ -0,0 +1,237 @@
+import argparse
+import mmap
+import os
+import struct
+import sys
+import time
+import numpy as np
+from search_state import WHITE, TURN, SIZE
+
+# One-sided bear-off database: for every way of placing up to 15 checkers on
+# the 6 home points, the probability of needing exactly n rolls to bear them
+# all off, n = 0..31, stored as little-endian uint16 fractions of 65535.
+POINTS = 6
+CHECKERS = 15
+SLOTS = 32
+SCALE = 65535
+MAGIC = b"BGBO"
+VERSION = 1
+HEADER = struct.Struct("<4sHHHHI")
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bearoff.bin")
+
+# The 21 distinct rolls with their probabilities
+ROLLS = [
+    (
+        (roll1,) * 4 if roll1 == roll2 else (roll1, roll2),
+        (1 if roll1 == roll2 else 2) / 36,
+    )
+    for roll1 in range(1, 7)
+    for roll2 in range(roll1, 7)
+]
+
+
+def ways(points, checkers):
+    """Number of ways to put at most checkers checkers on points points."""
+    count = 1
+    for i in range(1, points + 1):
+        count = count * (checkers + i) // i
+    return count
+
+
+COUNT = ways(POINTS, CHECKERS)
+
+# RANK[point, left, count]: how many positions come before the ones with count
+# checkers on point, given the earlier points and left checkers to place.
+RANK = np.zeros((POINTS, CHECKERS + 1, CHECKERS + 1), dtype=np.int64)
+for point in range(POINTS):
+    for left in range(CHECKERS + 1):
+        for count in range(1, left + 1):
+            RANK[point, left, count] = RANK[point, left, count - 1] + ways(
+                POINTS - 1 - point, left - count + 1
+            )
+
+
+def position_index(counts):
+    """Index of counts (checkers on the 1..6 points) in the database."""
+    index = 0
+    left = CHECKERS
+    for point, count in enumerate(counts):
+        index += RANK[point, left, count]
+        left -= count
+    return int(index)
+
+
+def side_counts(cells):
+    """(N, 6) home-board counts of each side, nearest point first."""
+    cells = np.asarray(cells, dtype=np.int32).reshape(-1, SIZE)
+    white = np.maximum(-cells[:, :POINTS], 0)
+    black = np.maximum(cells[:, 24 - POINTS : 24][:, ::-1], 0)
+    return white, black
+
+
+def bearing_off(cells):
+    """True where both sides have every checker left in their home board."""
+    cells = np.asarray(cells, dtype=np.int32).reshape(-1, SIZE)
+    white_out = (cells[:, POINTS:24] < 0).any(axis=1) | (cells[:, 24] > 0)
+    black_out = (cells[:, : 24 - POINTS] > 0).any(axis=1) | (cells[:, 25] > 0)
+    return ~white_out & ~black_out
+
+
+def batch_index(counts):
+    counts = np.asarray(counts, dtype=np.int64)
+    left = CHECKERS - np.concatenate(
+        [np.zeros((len(counts), 1), dtype=np.int64), np.cumsum(counts, axis=1)[:, :-1]],
+        axis=1,
+    )
+    return RANK[np.arange(POINTS), left, counts].sum(axis=1)
+
+
+class BearoffDatabase:
+    """Read-only view of a database file, shared between processes by mmap."""
+
+    def __init__(self, path=DEFAULT_PATH):
+        with open(path, "rb") as handle:
+            self.map = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+        self.path = path
+        magic, version, points, checkers, slots, count = HEADER.unpack_from(self.map)
+        if (magic, version, points, checkers, slots, count) != (
+            MAGIC,
+            VERSION,
+            POINTS,
+            CHECKERS,
+            SLOTS,
+            COUNT,
+        ):
+            self.map.close()
+            raise ValueError(f"{path} is not a version {VERSION} bear-off database")
+        self.table = np.frombuffer(
+            self.map, dtype="<u2", count=COUNT * SLOTS, offset=HEADER.size
+        ).reshape(COUNT, SLOTS)
+
+    def distribution(self, counts):
+        """P(bearing off takes exactly n rolls) for one side's counts."""
+        return self.table[position_index(counts)] / SCALE
+
+    def values(self, cells):
+        """White's value in [-1, 1] for an (N, 29) batch where both sides are
+        bearing off: the chance that the side on roll finishes first."""
+        cells = np.asarray(cells, dtype=np.int32).reshape(-1, SIZE)
+        white, black = side_counts(cells)
+        white_rolls = self.table[batch_index(white)] / SCALE
+        black_rolls = self.table[batch_index(black)] / SCALE
+        white_roll = cells[:, TURN] == WHITE
+        roller = np.where(white_roll[:, None], white_rolls, black_rolls)
+        other = np.where(white_roll[:, None], black_rolls, white_rolls)
+        # The roller wins if it needs no more rolls than the other side
+        other_left = 1 - np.cumsum(other, axis=1) + other
+        wins = np.clip((roller * other_left).sum(axis=1), 0, 1)
+        return np.where(white_roll, 2 * wins - 1, 1 - 2 * wins)
+
+    def value(self, cells):
+        return float(self.values(cells)[0])
+
+    def close(self):
+        self.table = None
+        self.map.close()
+
+
+_database = None
+
+
+def open_database(path=DEFAULT_PATH):
+    """Return the shared database for path, or None if it has not been built."""
+    global _database
+    if _database is None or _database.path != path:
+        if not os.path.exists(path):
+            return None
+        _database = BearoffDatabase(path)
+    return _database
+
+
+def plays(counts, dice):
+    """Every distinct result of playing dice on one side's home board."""
+    results = {counts}
+    for die in dice:
+        following = set()
+        for counts in results:
+            if not any(counts):
+                following.add(counts)
+                continue
+            highest = max(point for point in range(POINTS) if counts[point])
+            for point in range(POINTS):
+                if not counts[point]:
+                    continue
+                end = point - die
+                if end < -1 and point != highest:
+                    continue
+                moved = list(counts)
+                moved[point] -= 1
+                if end >= 0:
+                    moved[end] += 1
+                following.add(tuple(moved))
+        results = following
+    return results
+
+
+def build(path=DEFAULT_PATH):
+    """Generate the database, fewest pips first, and write it to path."""
+    positions = []
+
+    def place(prefix, left):
+        if len(prefix) == POINTS:
+            positions.append(tuple(prefix))
+            return
+        for count in range(left + 1):
+            place(prefix + [count], left - count)
+
+    place([], CHECKERS)
+    positions.sort(key=lambda counts: sum((i + 1) * c for i, c in enumerate(counts)))
+
+    table = np.zeros((COUNT, SLOTS))
+    means = np.zeros(COUNT)
+    table[position_index((0,) * POINTS), 0] = 1
+    for counts in positions:
+        if not any(counts):
+            continue
+        index = position_index(counts)
+        for dice, probability in ROLLS:
+            # One-sided best play: fewest rolls still needed on average
+            best = min(
+                (position_index(result) for result in plays(counts, dice)),
+                key=lambda result: means[result],
+            )
+            table[index, 1:] += probability * table[best, :-1]
+            means[index] += probability * (1 + means[best])
+
+    data = np.rint(table * SCALE).astype("<u2")
+    with open(path, "wb") as handle:
+        handle.write(HEADER.pack(MAGIC, VERSION, POINTS, CHECKERS, SLOTS, COUNT))
+        handle.write(data.tobytes())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="One-sided bear-off database")
+    parser.add_argument("command", choices=["build", "info"])
+    parser.add_argument("--path", default=DEFAULT_PATH)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        began = time.perf_counter()
+        build(args.path)
+        print(
+            f"Wrote {COUNT} positions to {args.path} "
+            f"in {time.perf_counter() - began:.0f}s"
+        )
+        return
+
+    database = open_database(args.path)
+    if database is None:
+        sys.exit(f"{args.path} not found, run `python bearoff.py build` first")
+    rolls = np.arange(SLOTS)
+    for counts in [(1, 0, 0, 0, 0, 0), (0, 0, 0, 0, 0, 1), (2, 2, 3, 2, 3, 3)]:
+        distribution = database.distribution(counts)
+        print(f"{counts}: {(distribution * rolls).sum():.3f} rolls on average")
+
+
+if __name__ == "__main__":
+    main()
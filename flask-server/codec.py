@@ -0,0 +1,393 @@
+import argparse
+import contextlib
+import io
+import json
+import struct
+import sys
+import time
+import zlib
+from functools import cached_property
+
+# Game blob: a header, a table of (section, length) pairs, then the sections
+# back to back. With FLAG_ZLIB the sections are compressed as a whole and the
+# table gives their lengths once inflated. Rows written before this format
+# are JSON text from Backgammon.to_json and still decode.
+MAGIC = b"BGGS"
+VERSION = 1
+HEADER = struct.Struct("<4sBBB")  # magic, version, flags, section count
+SECTION = struct.Struct("<BI")  # section id, length
+FLAG_ZLIB = 1
+# Smaller blobs are stored raw; zlib's framing costs more than it saves
+COMPRESS_OVER = 256
+
+PLAYERS, BOARD, STATE, CHECKERS, HISTORY = range(1, 6)
+
+TEXT = struct.Struct("<H")
+# Points, bars, then off counts
+BOARD_CELLS = struct.Struct("<26b2B")
+# Turn (NO_TURN if undecided), flags, restarts, number of rolls
+STATE_FIELDS = struct.Struct("<BBHB")
+NO_TURN = 255
+REAL_GAME = 1
+END_OF_TURN = 2
+CHECKER = struct.Struct("<Bdd")
+COLUMNS = 28
+# Pointer, number of moves, number of rolls at the start of the log; then
+# the rolls and a (start, end, die, hit) record per move
+HISTORY_FIELDS = struct.Struct("<hHB")
+MOVE = struct.Struct("<4B")
+# Color, home (off) and dead (bar) position of each seat
+SEATS = (("White", 26, 24), ("Black", 27, 25))
+
+
+def pack_text(text):
+    data = text.encode()
+    return TEXT.pack(len(data)) + data
+
+
+def unpack_text(data, offset):
+    (length,) = TEXT.unpack_from(data, offset)
+    offset += TEXT.size
+    return bytes(data[offset : offset + length]).decode(), offset + length
+
+
+def encode_players(players):
+    return b"".join(pack_text(player.name) + pack_text(player.AI) for player in players)
+
+
+def decode_players(data):
+    from OOP_Backgammon import Player
+
+    players = []
+    offset = 0
+    for color, home_position, dead_position in SEATS:
+        name, offset = unpack_text(data, offset)
+        ai, offset = unpack_text(data, offset)
+        players.append(Player(name, color, home_position, dead_position, ai))
+    return players
+
+
+def encode_board(board, players):
+    return BOARD_CELLS.pack(
+        *board.board.tolist(),
+        *(player.num_dead_pieces for player in players),
+        *(player.num_home_pieces for player in players),
+    )
+
+
+def decode_counters(data, players):
+    """Set players' bar and off counts from a board section."""
+    cells = BOARD_CELLS.unpack_from(data)
+    for player, dead, home in zip(players, cells[24:26], cells[26:28]):
+        player.num_dead_pieces = dead
+        player.num_home_pieces = home
+
+
+def decode_board(data, players):
+    """The Board in data; the bar and off counts go to players."""
+    from OOP_Backgammon import Board
+
+    decode_counters(data, players)
+    return Board.from_points(BOARD_CELLS.unpack_from(data)[:24])
+
+
+def encode_state(turn, rolls, message, flags=0, restarts=0):
+    return (
+        STATE_FIELDS.pack(
+            NO_TURN if turn is None else turn, flags, restarts, len(rolls)
+        )
+        + bytes(rolls)
+        + pack_text(json.dumps(message))
+    )
+
+
+def decode_state(data):
+    """(turn, rolls, message, flags, restarts)."""
+    turn, flags, restarts, count = STATE_FIELDS.unpack_from(data)
+    offset = STATE_FIELDS.size
+    rolls = list(data[offset : offset + count])
+    message, _ = unpack_text(data, offset + count)
+    turn = None if turn == NO_TURN else turn
+    return turn, rolls, json.loads(message), flags, restarts
+
+
+def encode_checkers(checkers, columns):
+    pack = CHECKER.pack
+    return b"".join(
+        [
+            bytes([len(checkers)]),
+            *[pack(checker.id, checker.x, checker.y) for checker in checkers],
+            bytes([len(columns[column]) for column in range(COLUMNS)]),
+            bytes([index for column in range(COLUMNS) for index in columns[column]]),
+        ]
+    )
+
+
+def decode_checkers(data):
+    """(checkers, columns)."""
+    from OOP_Backgammon import Checker
+
+    end = 1 + data[0] * CHECKER.size
+    checkers = [Checker(*fields) for fields in CHECKER.iter_unpack(data[1:end])]
+    sizes = data[end : end + COLUMNS].tolist()
+    indices = data[end + COLUMNS :].tolist()
+    columns = {}
+    offset = 0
+    for column, size in enumerate(sizes):
+        columns[column] = indices[offset : offset + size]
+        offset += size
+    return checkers, columns
+
+
+def encode_history(history, pointer, rolls):
+    return (
+        HISTORY_FIELDS.pack(pointer, len(history), len(rolls))
+        + bytes(rolls)
+        + b"".join(MOVE.pack(*move) for move in history)
+    )
+
+
+def decode_history(data):
+    """(history, pointer, rolls at the start of the log)."""
+    pointer, count, roll_count = HISTORY_FIELDS.unpack_from(data)
+    offset = HISTORY_FIELDS.size
+    rolls = list(data[offset : offset + roll_count])
+    offset += roll_count
+    history = [
+        (start, end, roll, bool(hit))
+        for start, end, roll, hit in MOVE.iter_unpack(
+            data[offset : offset + count * MOVE.size]
+        )
+    ]
+    return history, pointer, rolls
+
+
+def encode(game, compress=None):
+    """The game as a versioned binary blob. compress=None compresses blobs
+    over COMPRESS_OVER bytes."""
+    flags = (REAL_GAME if game.real_game else 0) | (
+        END_OF_TURN if game.end_of_turn else 0
+    )
+    sections = [
+        (PLAYERS, encode_players(game.players)),
+        (BOARD, encode_board(game.game_board, game.players)),
+        (
+            STATE,
+            encode_state(
+                game.current_turn, game.rolls, game.message, flags, game.num_restarts
+            ),
+        ),
+        (CHECKERS, encode_checkers(game.checkers, game.columns)),
+        (
+            HISTORY,
+            encode_history(game.history, game.history_pointer, game.history_rolls),
+        ),
+    ]
+    table = b"".join(SECTION.pack(section, len(body)) for section, body in sections)
+    body = b"".join(body for _, body in sections)
+    if compress is None:
+        compress = len(body) > COMPRESS_OVER
+    if compress:
+        body = zlib.compress(body)
+    header = HEADER.pack(MAGIC, VERSION, FLAG_ZLIB if compress else 0, len(sections))
+    return header + table + body
+
+
+def is_legacy(data):
+    """True for rows written as JSON text."""
+    return isinstance(data, str) or bytes(data[:1]) == b"{"
+
+
+def read_sections(data):
+    """{section id: memoryview} for a binary blob, inflating it if needed."""
+    magic, version, flags, count = HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"not a version {VERSION} game blob")
+    offset = HEADER.size + count * SECTION.size
+    body = data[offset:]
+    if flags & FLAG_ZLIB:
+        body = zlib.decompress(body)
+    body = memoryview(body)
+    sections = {}
+    offset = 0
+    for i in range(count):
+        section, length = SECTION.unpack_from(data, HEADER.size + i * SECTION.size)
+        sections[section] = body[offset : offset + length]
+        offset += length
+    return sections
+
+
+def decode(data):
+    """The Backgammon in a blob from encode, or in a legacy JSON row."""
+    from OOP_Backgammon import Backgammon
+
+    if is_legacy(data):
+        return Backgammon.from_json(
+            data if isinstance(data, str) else bytes(data).decode()
+        )
+    sections = read_sections(data)
+    players = decode_players(sections[PLAYERS])
+    turn, rolls, message, flags, restarts = decode_state(sections[STATE])
+    game = Backgammon.blank(players)
+    game.game_board = decode_board(sections[BOARD], players)
+    game.current_turn = turn
+    game.rolls = rolls
+    game.history, game.history_pointer, game.history_rolls = decode_history(
+        sections[HISTORY]
+    )
+    game.real_game = bool(flags & REAL_GAME)
+    game.end_of_turn = bool(flags & END_OF_TURN)
+    game.num_restarts = restarts
+    game.message = message
+    game.checkers, game.columns = decode_checkers(sections[CHECKERS])
+    game.rehash()
+    return game
+
+
+class GameView:
+    """Read-only game over a blob, decoding each section on first use.
+
+    It has the fields the read-only handlers look at (players, current_turn,
+    rolls, message, num_restarts, checkers, game_board) and check_winner, so
+    those handlers never build the board, checkers or undo log they skip.
+    """
+
+    def __init__(self, data):
+        self.sections = read_sections(data)
+
+    @cached_property
+    def players(self):
+        players = decode_players(self.sections[PLAYERS])
+        decode_counters(self.sections[BOARD], players)
+        return players
+
+    @cached_property
+    def game_board(self):
+        return decode_board(self.sections[BOARD], self.players)
+
+    @cached_property
+    def state(self):
+        return decode_state(self.sections[STATE])
+
+    @property
+    def current_turn(self):
+        return self.state[0]
+
+    @property
+    def rolls(self):
+        return self.state[1]
+
+    @cached_property
+    def message(self):
+        # Assignable, since check_winner sets it
+        return self.state[2]
+
+    @property
+    def real_game(self):
+        return bool(self.state[3] & REAL_GAME)
+
+    @property
+    def end_of_turn(self):
+        return bool(self.state[3] & END_OF_TURN)
+
+    @property
+    def num_restarts(self):
+        return self.state[4]
+
+    @cached_property
+    def checkers(self):
+        return decode_checkers(self.sections[CHECKERS])[0]
+
+    def check_winner(self):
+        from OOP_Backgammon import Backgammon
+
+        return Backgammon.check_winner(self)
+
+
+def open_view(data):
+    """A GameView of a blob, or the whole game for a legacy JSON row."""
+    return decode(data) if is_legacy(data) else GameView(data)
+
+
+def sample_game(moves, seed=0):
+    """A game a few moves into its first turn, with the log a real game keeps
+    for undo."""
+    import random
+    from OOP_Backgammon import Backgammon
+
+    random.seed(seed)
+    with contextlib.redirect_stdout(io.StringIO()):
+        game = Backgammon("White", "Black", "User", "User")
+    game.rolls = [6, 6, 6, 6]
+    for _ in range(moves):
+        player = game.players[game.current_turn]
+        starts = game.game_board.possible_starts(game.rolls, player)
+        if not starts:
+            break
+        possible = game.game_board.possible_moves(starts[0], game.rolls, player)
+        game.make_move(starts[0], next(iter(possible)), possible)
+    return game
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Binary game codec")
+    parser.add_argument("command", choices=["bench", "migrate"])
+    parser.add_argument("--moves", type=int, default=4, help="moves in the bench game")
+    parser.add_argument("--repeats", type=int, default=1000)
+    args = parser.parse_args()
+
+    if args.command == "migrate":
+        from storage import Storage
+
+        storage = Storage()
+        migrated = 0
+        for game_id, game_data in storage.rows():
+            # Lobbies waiting for a second player are not games yet
+            if not is_legacy(game_data) or "players" not in json.loads(game_data):
+                continue
+            storage.save(game_id, encode(decode(game_data)))
+            migrated += 1
+        print(f"Migrated {migrated} games in {storage.path}")
+        return
+
+    from OOP_Backgammon import Backgammon
+
+    game = sample_game(args.moves)
+    text = game.to_json()
+    blob = encode(game)
+    # Coordinates come back as floats, so compare values rather than text
+    if json.loads(decode(blob).to_json()) != json.loads(text):
+        sys.exit("round trip through the codec changed the game")
+    timings = []
+    for write, read, data in (
+        (game.to_json, Backgammon.from_json, text),
+        (lambda: encode(game), decode, blob),
+    ):
+        began = time.perf_counter()
+        for _ in range(args.repeats):
+            write()
+        middle = time.perf_counter()
+        for _ in range(args.repeats):
+            read(data)
+        ended = time.perf_counter()
+        timings.append(
+            ((middle - began) / args.repeats, (ended - middle) / args.repeats)
+        )
+    began = time.perf_counter()
+    for _ in range(args.repeats):
+        view = GameView(blob)
+        view.players[view.current_turn].name, view.rolls, view.num_restarts
+        [checker.to_dict() for checker in view.checkers]
+    viewed = (time.perf_counter() - began) / args.repeats
+    for name, size, (write, read) in zip(
+        ("json", "binary"), (len(text.encode()), len(blob)), timings
+    ):
+        print(
+            f"{name}: {size} bytes, encode {write * 1e6:.0f} us, "
+            f"decode {read * 1e6:.0f} us"
+        )
+    print(f"state fields from a GameView: {viewed * 1e6:.0f} us")
+
+
+if __name__ == "__main__":
+    main()
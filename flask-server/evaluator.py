@@ -0,0 +1,167 @@
+import time
+import numpy as np
+from search_state import WHITE, TURN, SIZE
+
+# Weights of the contact evaluation, applied to each side's features (own
+# minus opponent's) before the tanh.
+PIP_WEIGHT = 0.01
+POINT_WEIGHT = 0.03
+HOME_POINT_WEIGHT = 0.08
+PRIME_WEIGHT = 0.05
+ANCHOR_WEIGHT = 0.06
+BLOT_WEIGHT = 0.04
+# A blot the side on roll can hit costs far more than one it leaves itself
+EXPOSED_WEIGHT = 0.12
+ROLLER_EXPOSED_WEIGHT = 0.03
+BAR_WEIGHT = 0.15
+OFF_WEIGHT = 0.02
+ON_ROLL = 0.05
+# Races: a lead of 8% of the pip count is worth about 75% to win
+RACE_SCALE = 7
+RACE_ON_ROLL = 4
+
+
+def side_views(cells):
+    """Each side's (N, 24) view of the points: own checkers positive, index i
+    is i + 1 pips from bearing off. Returns (white_view, black_view)."""
+    points = cells[:, :24]
+    return -points, points[:, ::-1]
+
+
+def pip_counts(view, bar):
+    return (np.maximum(view, 0) * np.arange(1, 25)).sum(axis=1) + 25 * bar
+
+
+def highest_checker(view, bar):
+    """Index of each side's furthest-back checker, 24 on the bar, -1 if none."""
+    own = view > 0
+    highest = np.where(own.any(axis=1), 23 - own[:, ::-1].argmax(axis=1), -1)
+    return np.where(bar > 0, 24, highest)
+
+
+def is_contact(cells):
+    """True where either side can still hit the other."""
+    cells = np.asarray(cells).reshape(-1, SIZE)
+    white_view, black_view = side_views(cells)
+    white_back = highest_checker(white_view, cells[:, 24])
+    black_back = highest_checker(black_view, cells[:, 25])
+    # Black's furthest-back checker sits on White's point 23 - black_back
+    return (white_back >= 0) & (black_back >= 0) & (white_back + black_back > 23)
+
+
+def side_features(view, bar, opponent_bar):
+    """(points, home points, prime, anchors, blots, exposed blots) per row."""
+    made = view >= 2
+    points = made.sum(axis=1)
+    home_points = made[:, :6].sum(axis=1)
+    anchors = made[:, 18:].sum(axis=1)
+    prime = np.zeros(len(view), dtype=np.int32)
+    run = np.zeros(len(view), dtype=np.int32)
+    for i in range(24):
+        run = (run + 1) * made[:, i]
+        prime = np.maximum(prime, run)
+
+    # The opponent moves up this view and enters from just below index 0
+    blots = view == 1
+    shooters = np.concatenate([(opponent_bar > 0)[:, None], view < 0], axis=1)
+    shots = np.zeros(view.shape, dtype=bool)
+    for distance in range(1, 7):
+        shots[:, distance - 1 :] |= shooters[:, : 25 - distance]
+    exposed = (blots & shots).sum(axis=1)
+    return points, home_points, prime, anchors, blots.sum(axis=1), exposed
+
+
+def evaluate(cells):
+    """White's value in [-1, 1] for an (N, 29) batch of Position cells.
+
+    Contact positions use a weighted sum of pip counts, made points, home
+    board points, primes, anchors, blots, blots the side on roll can hit, and
+    bar and off counts. Races use the pip counts alone.
+    """
+    cells = np.asarray(cells, dtype=np.int32).reshape(-1, SIZE)
+    white_view, black_view = side_views(cells)
+    white_bar, black_bar = cells[:, 24], cells[:, 25]
+    white_off, black_off = cells[:, 26], cells[:, 27]
+    white_roll = cells[:, TURN] == WHITE
+    roll_sign = np.where(white_roll, 1, -1)
+    white_pips = pip_counts(white_view, white_bar)
+    black_pips = pip_counts(black_view, black_bar)
+
+    white = side_features(white_view, white_bar, black_bar)
+    black = side_features(black_view, black_bar, white_bar)
+    score = (
+        PIP_WEIGHT * (black_pips - white_pips)
+        + POINT_WEIGHT * (white[0] - black[0])
+        + HOME_POINT_WEIGHT * (white[1] - black[1])
+        + PRIME_WEIGHT * (np.maximum(white[2] - 2, 0) - np.maximum(black[2] - 2, 0))
+        + ANCHOR_WEIGHT * (white[3] - black[3])
+        - BLOT_WEIGHT * (white[4] - black[4])
+        - np.where(white_roll, ROLLER_EXPOSED_WEIGHT, EXPOSED_WEIGHT) * white[5]
+        + np.where(white_roll, EXPOSED_WEIGHT, ROLLER_EXPOSED_WEIGHT) * black[5]
+        - BAR_WEIGHT * (white_bar - black_bar)
+        + OFF_WEIGHT * (white_off - black_off)
+        + ON_ROLL * roll_sign
+    )
+    contact_values = np.tanh(score)
+
+    lead = black_pips - white_pips + RACE_ON_ROLL * roll_sign
+    mean_pips = np.maximum((white_pips + black_pips) / 2, 1)
+    race_values = np.tanh(RACE_SCALE * lead / mean_pips)
+
+    values = np.where(is_contact(cells), contact_values, race_values)
+    values[white_off == 15] = 1
+    values[black_off == 15] = -1
+    return values
+
+
+def pip_evaluate(cells):
+    """White's value in [-1, 1] for an (N, 29) batch, from the pip counts."""
+    cells = np.asarray(cells, dtype=np.int32).reshape(-1, SIZE)
+    white_view, black_view = side_views(cells)
+    lead = pip_counts(black_view, cells[:, 25]) - pip_counts(white_view, cells[:, 24])
+    # Being on roll is worth about half a roll
+    lead += np.where(cells[:, TURN] == WHITE, 4, -4)
+    values = np.tanh(lead / 40)
+    values[cells[:, 26] == 15] = 1
+    values[cells[:, 27] == 15] = -1
+    return values
+
+
+def get_evaluator(name):
+    """Leaf evaluator by name: "static", "pips" or "neural". "neural" falls
+    back to the static evaluator while there is no weights file."""
+    if name == "neural":
+        from neural import load_network
+
+        return load_network() or evaluate
+    if name == "pips":
+        return pip_evaluate
+    return evaluate
+
+
+def main():
+    from rollout import Playout
+    from OOP_Backgammon import Backgammon
+    from search_state import Position
+
+    game = Backgammon("White", "Black", "Random", "Random")
+    game.real_game = False
+    start = Position.from_game(game)
+    playout = Playout(seed=1)
+    positions = []
+    while len(positions) < 10000:
+        playout.play(start, max_plies=int(playout.random.random() * 60))
+        positions.append(playout.cells[:])
+    cells = np.array(positions, dtype=np.int8)
+
+    began = time.perf_counter()
+    values = evaluate(cells)
+    elapsed = time.perf_counter() - began
+    print(
+        f"evaluate: {len(cells) / elapsed:.0f} positions/s, "
+        f"{is_contact(cells).mean():.2f} contact, mean value {values.mean():.3f}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+import time
+import numpy as np
+from search_state import Position, WHITE
+from move_generator import legal_plays
+from evaluator import evaluate, get_evaluator
+
+# The 21 distinct rolls with their probabilities
+CHANCE_ROLLS = [
+    (
+        [roll1] * 4 if roll1 == roll2 else [roll1, roll2],
+        (1 if roll1 == roll2 else 2) / 36,
+    )
+    for roll1 in range(1, 7)
+    for roll2 in range(roll1, 7)
+]
+
+# Move filters by remaining depth, in the spirit of gnubg's: after the static
+# evaluation of every play, keep at most `keep` plays within `threshold` of
+# the best one for a deeper look.
+MOVE_FILTERS = {
+    1: (8, 0.16),
+    2: (4, 0.08),
+}
+
+# Budgets per AI setting, like MCTS.SEARCH_BUDGETS
+PLY_BUDGETS = {
+    "Expectiminimax": {"plies": 2},
+    "Neural": {"plies": 2, "evaluate": "neural"},
+}
+
+
+class Choice:
+    """A chosen play: the resulting position and its value for White."""
+
+    def __init__(self, game, value):
+        self.game = game
+        self.value = value
+
+
+class Expectiminimax:
+    """n-ply search: move nodes over full plays, chance nodes over 21 rolls.
+
+    Leaves are scored in one batch per move node by evaluate, and move filters
+    prune the plays that are searched deeper. There is no randomness, so the
+    same position always costs the same.
+    """
+
+    def __init__(self, plies=2, evaluate=evaluate, move_filters=MOVE_FILTERS):
+        self.plies = plies
+        if isinstance(evaluate, str):
+            evaluate = get_evaluator(evaluate)
+        self.evaluate = evaluate
+        self.move_filters = move_filters
+        self.nodes = 0
+
+    def search(self, inital_state):
+        root = Position.from_game(inital_state)
+        states = list(inital_state.possible_states())
+        self.nodes = 0
+        if len(states) == 1:
+            return Choice(states[0], None)
+        sign = 1 if root.turn == WHITE else -1
+        values = self.play_values(states, self.plies - 1)
+        best = max(range(len(states)), key=lambda i: sign * values[i])
+        return Choice(states[best], values[best])
+
+    def play_values(self, states, depth):
+        """White's value of each play, searching the filtered ones deeper.
+        Plays the filters prune are valued at minus infinity for the mover,
+        so only plays searched to the same depth compete."""
+        self.nodes += len(states)
+        values = self.evaluate([state.cells for state in states])
+        if depth == 0 or len(states) == 0:
+            return values
+        # The mover is the side not to move in the resulting positions
+        sign = -1 if states[0].turn == WHITE else 1
+        keep, threshold = self.move_filters.get(depth, (len(states), 2))
+        order = np.argsort(-sign * values, kind="stable")
+        best = sign * values[order[0]]
+        pruned = np.ones(len(states), dtype=bool)
+        for i in order[:keep]:
+            if best - sign * values[i] > threshold:
+                break
+            pruned[i] = False
+            if not states[i].check_winner():
+                values[i] = self.chance_value(states[i], depth)
+        values[pruned] = -sign * np.inf
+        return values
+
+    def chance_value(self, position, depth):
+        """White's expected value over the 21 rolls of the side to move."""
+        sign = 1 if position.turn == WHITE else -1
+        total = 0
+        for rolls, probability in CHANCE_ROLLS:
+            plays = [state for state, moves in legal_plays(position, rolls)]
+            values = self.play_values(plays, depth - 1)
+            total += probability * sign * (sign * values).max()
+        return total
+
+
+def main():
+    from OOP_Backgammon import Backgammon
+
+    game = Backgammon("White", "Black", "Expectiminimax", "Expectiminimax")
+    game.real_game = False
+    for plies in (1, 2):
+        engine = Expectiminimax(plies=plies)
+        began = time.perf_counter()
+        for rolls, probability in CHANCE_ROLLS:
+            game.rolls = rolls[:]
+            engine.search(game)
+        elapsed = time.perf_counter() - began
+        print(
+            f"{plies}-ply: {elapsed / len(CHANCE_ROLLS) * 1000:.0f} ms per move, "
+            f"{engine.nodes} positions evaluated in the last search"
+        )
+
+
+if __name__ == "__main__":
+    main()
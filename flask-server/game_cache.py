@@ -0,0 +1,182 @@
+import atexit
+import os
+import threading
+from collections import OrderedDict
+
+# Games are cached per process, so the server must run a single worker
+# process (threads or greenlets are fine).
+CAPACITY = int(os.environ.get("GAME_CACHE_SIZE", "512"))
+FLUSH_INTERVAL = float(os.environ.get("GAME_CACHE_FLUSH", "1.0"))
+
+
+class GameCache:
+    """game_id -> the latest blob of a game, evicting the least recently used.
+
+    load(game_id) returns a stored blob or None, save(game_id, data) stores
+    one, and encode and decode convert between games and blobs. get decodes a
+    private copy for each request, as reading it from storage would, so
+    handlers never share a game and the changes of one that fails or never
+    puts the game back are dropped. A handler puts the game back after
+    changing it, which encodes it and marks it dirty. A background thread
+    writes the dirty blobs every interval seconds, when they are evicted, and
+    at exit. open_view(data), if given, returns a cheaper read-only stand-in
+    for a blob.
+    """
+
+    def __init__(
+        self,
+        load,
+        save,
+        encode,
+        decode,
+        open_view=None,
+        capacity=CAPACITY,
+        interval=FLUSH_INTERVAL,
+    ):
+        self.load = load
+        self.save = save
+        self.encode = encode
+        self.decode = decode
+        self.open_view = open_view
+        self.capacity = capacity
+        self.interval = interval
+        self.blobs = OrderedDict()
+        self.dirty = set()
+        # Dirty blobs pushed out of the cache, kept until they are written
+        self.evicted = {}
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.thread = None
+        self.closed = False
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+
+    def blob(self, game_id):
+        """The latest blob for game_id, read from storage on a miss. Returns
+        None if the game does not exist."""
+        with self.lock:
+            data = self.blobs.get(game_id)
+            if data is None:
+                data = self.evicted.pop(game_id, None)
+                if data is not None:
+                    self.blobs[game_id] = data
+                    self.evict()
+            if data is not None:
+                self.blobs.move_to_end(game_id)
+                self.hits += 1
+                return data
+            self.misses += 1
+        data = self.load(game_id)
+        if not data:
+            return None
+        with self.lock:
+            # A put meanwhile is newer than what storage had
+            data = self.blobs.setdefault(game_id, data)
+            self.blobs.move_to_end(game_id)
+            self.evict()
+        return data
+
+    def get(self, game_id):
+        """A private copy of the game for game_id, or None if it does not
+        exist. Put it back to keep changes made to it."""
+        data = self.blob(game_id)
+        return None if data is None else self.decode(data)
+
+    def view(self, game_id):
+        """A read-only view of the game for game_id, or None if it does not
+        exist. Changes made to it are never saved."""
+        if self.open_view is None:
+            return self.get(game_id)
+        data = self.blob(game_id)
+        return None if data is None else self.open_view(data)
+
+    def put(self, game_id, game):
+        """Cache game after a change; it is written on the next flush."""
+        data = self.encode(game)
+        with self.lock:
+            self.evicted.pop(game_id, None)
+            self.blobs[game_id] = data
+            self.blobs.move_to_end(game_id)
+            self.dirty.add(game_id)
+            self.evict()
+
+    def add(self, game_id, game):
+        """Cache a new game and write it through straight away."""
+        data = self.encode(game)
+        self.save(game_id, data)
+        self.writes += 1
+        with self.lock:
+            self.evicted.pop(game_id, None)
+            self.dirty.discard(game_id)
+            self.blobs[game_id] = data
+            self.blobs.move_to_end(game_id)
+            self.evict()
+
+    def evict(self):
+        # Called with the lock held
+        while len(self.blobs) > self.capacity:
+            game_id, data = self.blobs.popitem(last=False)
+            if game_id in self.dirty:
+                self.evicted[game_id] = data
+                self.wake.set()
+
+    def flush(self):
+        """Write every dirty blob. Returns the number written."""
+        with self.lock:
+            batch = [
+                (game_id, self.blobs.get(game_id, self.evicted.get(game_id)))
+                for game_id in self.dirty
+            ]
+            self.dirty.clear()
+        written = 0
+        for game_id, data in batch:
+            try:
+                self.save(game_id, data)
+                written += 1
+            except Exception as error:
+                print(f"Could not save game {game_id}: {error!r}")
+                with self.lock:
+                    self.dirty.add(game_id)
+        with self.lock:
+            for game_id, data in batch:
+                if game_id not in self.dirty and self.evicted.get(game_id) is data:
+                    del self.evicted[game_id]
+            self.writes += written
+        return written
+
+    def start(self):
+        """Start the background writer and flush again at exit."""
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, daemon=True)
+            self.thread.start()
+            atexit.register(self.close)
+
+    def run(self):
+        while not self.closed:
+            self.wake.wait(self.interval)
+            self.wake.clear()
+            self.flush()
+
+    def close(self):
+        self.closed = True
+        self.wake.set()
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join()
+        self.flush()
+
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def __len__(self):
+        return len(self.blobs)
+
+    def __contains__(self, game_id):
+        return game_id in self.blobs or game_id in self.evicted
+
+    def __str__(self):
+        return (
+            f"{len(self.blobs)}/{self.capacity} games, {len(self.dirty)} dirty, "
+            f"hit rate {self.hit_rate():.3f}, {self.writes} writes"
+        )
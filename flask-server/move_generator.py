@@ -0,0 +1,138 @@
+import numpy as np
+
+
+def legal_plays(position, rolls):
+    """Return [(position, moves)] for every distinct result of playing rolls.
+
+    A play uses as many dice as possible (up to four for doubles) and, when only
+    one of two different dice can be played, the larger one. Results are
+    collapsed by position while they are generated, and every candidate is
+    explored with apply/undo on one scratch position. Returned positions have
+    the turn passed to the opponent.
+    """
+    scratch = position.copy()
+    if len(set(rolls)) <= 1:
+        orders = [tuple(rolls)]
+    else:
+        orders = [tuple(rolls), tuple(reversed(rolls))]
+    plays = {}
+    seen = set()
+    moves = []
+    used = []
+    best = (0, 0)
+
+    def walk(dice):
+        nonlocal best
+        legal = scratch.moves_for_die(dice[0]) if dice else []
+        if not legal:
+            rank = (len(used), sum(used))
+            if rank > best:
+                best = rank
+                plays.clear()
+            if rank == best:
+                key = scratch.key
+                if key not in plays:
+                    result = scratch.copy()
+                    result.pass_turn()
+                    plays[key] = (result, tuple(moves))
+            return
+        visit = (scratch.key, dice)
+        if visit in seen:
+            return
+        seen.add(visit)
+        for start, end in legal:
+            record = scratch.apply(start, end)
+            moves.append((start, end))
+            used.append(dice[0])
+            walk(dice[1:])
+            used.pop()
+            moves.pop()
+            scratch.undo(record)
+
+    for dice in orders:
+        walk(dice)
+    return list(plays.values())
+
+
+def batch_move_mask(positions, dice, turns=None):
+    """Vectorised single-checker legality for a batch of positions.
+
+    positions is an (N, 26+) array laid out like Position cells (points, then
+    the White and Black bar). dice is (K,) or (N, K); zeros mark unused dice
+    and repeated dice are only reported once. turns is a scalar or (N,) array
+    and defaults to column 28 when positions carry it. Returns (legal, starts,
+    ends), each shaped (N, 25, K): start slot 24 is the bar, and starts/ends
+    hold Board indexes (24/25 for the bars, 26/27 for bearing off).
+    """
+    positions = np.asarray(positions)
+    count = len(positions)
+    if turns is None:
+        turns = positions[:, 28]
+    turns = np.broadcast_to(np.asarray(turns), (count,))
+    dice = np.broadcast_to(np.asarray(dice), (count, np.shape(dice)[-1]))
+    white = turns == 0
+
+    # Mover's view: own checkers positive, moving from high points to low.
+    points = positions[:, :24].astype(np.int16)
+    view = np.where(white[:, None], -points, points[:, ::-1])
+    bar = np.where(white, positions[:, 24], positions[:, 25])
+    occupied = view > 0
+    open_points = view >= -1
+    on_bar = bar > 0
+    highest = np.where(occupied.any(axis=1), 23 - occupied[:, ::-1].argmax(axis=1), -1)
+    bear_off = ~on_bar & (highest < 6)
+
+    usable = dice > 0
+    for slot in range(1, dice.shape[1]):
+        for earlier in range(slot):
+            usable[:, slot] &= dice[:, earlier] != dice[:, slot]
+
+    # landing[n, die, start]: the point die pips on from start is open.
+    landing = np.zeros((count, 7, 24), dtype=bool)
+    for die in range(1, 7):
+        landing[:, die, die:] = open_points[:, : 24 - die]
+
+    rows = np.arange(count)
+    point_index = np.arange(24)
+    legal = np.zeros((count, 25, dice.shape[1]), dtype=bool)
+    view_ends = np.zeros((count, 25, dice.shape[1]), dtype=np.int16)
+    for slot in range(dice.shape[1]):
+        die = dice[:, slot].astype(np.int16)
+        ends = point_index[None, :] - die[:, None]
+        lands = landing[rows, die]
+        moves = occupied & ~on_bar[:, None] & (ends >= 0) & lands
+        off = (
+            occupied
+            & bear_off[:, None]
+            & (ends < 0)
+            & ((ends == -1) | (point_index[None, :] == highest[:, None]))
+        )
+        legal[:, :24, slot] = (moves | off) & usable[:, slot : slot + 1]
+        view_ends[:, :24, slot] = np.where(ends < 0, -1, ends)
+        entry = np.clip(24 - die, 0, 23)
+        legal[:, 24, slot] = on_bar & usable[:, slot] & open_points[rows, entry]
+        view_ends[:, 24, slot] = entry
+
+    starts = np.where(white[:, None], point_index[None, :], 23 - point_index[None, :])
+    starts = np.concatenate([starts, np.where(white, 24, 25)[:, None]], axis=1)
+    starts = np.broadcast_to(starts[:, :, None], legal.shape)
+    ends = np.where(white[:, None, None], view_ends, 23 - view_ends)
+    ends = np.where(view_ends < 0, np.where(white, 26, 27)[:, None, None], ends)
+    return legal, starts, ends
+
+
+def batch_moves(positions, dice, turns=None):
+    """Return (rows, starts, ends, dice) for every legal move in a batch.
+
+    Takes the same arguments as batch_move_mask and flattens the result, so
+    thousands of positions are expanded in one call.
+    """
+    legal, starts, ends = batch_move_mask(positions, dice, turns)
+    rows, start_slots, die_slots = np.nonzero(legal)
+    dice = np.broadcast_to(np.asarray(dice), (len(legal), legal.shape[2]))
+    return (
+        rows,
+        starts[rows, start_slots, die_slots],
+        ends[rows, start_slots, die_slots],
+        dice[rows, die_slots],
+    )
@@ -0,0 +1,170 @@
+import os
+import time
+import numpy as np
+from search_state import WHITE, TURN, SIZE
+
+# Weights file: np.savez archive with a version, then W0, b0, W1, b1, ... for
+# each dense layer. Inputs are the TD-Gammon encoding of a position and the
+# outputs are White's chances to win, to win a gammon and to lose a gammon.
+VERSION = 1
+INPUTS = 198
+OUTPUTS = 3
+HIDDEN = (80,)
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "neural.npz")
+
+
+def encode(cells):
+    """(N, 198) TD-Gammon inputs for an (N, 29) batch of Position cells.
+
+    Four units per point and side (at least 1, 2 and 3 checkers, then half of
+    the rest), bar and off counts, and two units for the side to move.
+    """
+    cells = np.asarray(cells, dtype=np.float32).reshape(-1, SIZE)
+    count = len(cells)
+    inputs = np.empty((count, INPUTS), dtype=np.float32)
+    for offset, checkers in ((0, -cells[:, :24]), (96, cells[:, :24])):
+        checkers = np.maximum(checkers, 0)
+        units = inputs[:, offset : offset + 96].reshape(count, 24, 4)
+        units[:, :, 0] = checkers >= 1
+        units[:, :, 1] = checkers >= 2
+        units[:, :, 2] = checkers >= 3
+        units[:, :, 3] = np.maximum(checkers - 3, 0) / 2
+    inputs[:, 192] = cells[:, 24] / 2
+    inputs[:, 193] = cells[:, 25] / 2
+    inputs[:, 194] = cells[:, 26] / 15
+    inputs[:, 195] = cells[:, 27] / 15
+    inputs[:, 196] = cells[:, TURN] == WHITE
+    inputs[:, 197] = cells[:, TURN] != WHITE
+    return inputs
+
+
+def sigmoid(x):
+    return 1 / (1 + np.exp(-x))
+
+
+class Network:
+    """Dense sigmoid network, evaluated for a whole batch at once."""
+
+    def __init__(self, layers):
+        self.layers = [
+            (np.asarray(weights, dtype=np.float32), np.asarray(bias, dtype=np.float32))
+            for weights, bias in layers
+        ]
+        self.path = None
+
+    @classmethod
+    def random(cls, hidden=HIDDEN, seed=None):
+        rng = np.random.default_rng(seed)
+        sizes = (INPUTS,) + tuple(hidden) + (OUTPUTS,)
+        return cls(
+            [
+                (
+                    rng.normal(0, 1 / np.sqrt(fan_in), (fan_in, fan_out)),
+                    np.zeros(fan_out),
+                )
+                for fan_in, fan_out in zip(sizes, sizes[1:])
+            ]
+        )
+
+    @classmethod
+    def load(cls, path=DEFAULT_PATH):
+        with np.load(path) as data:
+            if int(data["version"]) != VERSION:
+                raise ValueError(f"{path} is not version {VERSION} network weights")
+            layers = [
+                (data[f"W{i}"], data[f"b{i}"]) for i in range(int(data["layers"]))
+            ]
+        if layers[0][0].shape[0] != INPUTS or layers[-1][0].shape[1] != OUTPUTS:
+            raise ValueError(f"{path} does not match the {INPUTS}-input encoding")
+        network = cls(layers)
+        network.path = path
+        return network
+
+    def save(self, path=DEFAULT_PATH):
+        arrays = {"version": np.array(VERSION), "layers": np.array(len(self.layers))}
+        for i, (weights, bias) in enumerate(self.layers):
+            arrays[f"W{i}"] = weights
+            arrays[f"b{i}"] = bias
+        # Write next to the target and rename, so readers never see half a file
+        temporary = f"{path}.tmp.npz"
+        np.savez(temporary, **arrays)
+        os.replace(temporary, path)
+
+    def forward(self, inputs):
+        """(N, 3) outputs for (N, 198) inputs."""
+        activations = inputs
+        for weights, bias in self.layers:
+            activations = sigmoid(activations @ weights + bias)
+        return activations
+
+    def train(self, inputs, targets, rate):
+        """One gradient step on the mean cross-entropy between the outputs and
+        (N, 3) targets. Returns the loss before the step."""
+        activations = [inputs]
+        for weights, bias in self.layers:
+            activations.append(sigmoid(activations[-1] @ weights + bias))
+        outputs = np.clip(activations[-1], 1e-7, 1 - 1e-7)
+        loss = -np.mean(targets * np.log(outputs) + (1 - targets) * np.log(1 - outputs))
+        delta = (activations[-1] - targets) / len(inputs)
+        for i in reversed(range(len(self.layers))):
+            weights, bias = self.layers[i]
+            weight_step = activations[i].T @ delta
+            bias_step = delta.sum(axis=0)
+            if i:
+                delta = (delta @ weights.T) * activations[i] * (1 - activations[i])
+            self.layers[i] = (weights - rate * weight_step, bias - rate * bias_step)
+        return float(loss)
+
+    def evaluate(self, cells):
+        """White's value in [-1, 1] for an (N, 29) batch, like
+        evaluator.evaluate. Gammons do not count in this game."""
+        cells = np.asarray(cells).reshape(-1, SIZE)
+        values = 2 * self.forward(encode(cells))[:, 0].astype(np.float64) - 1
+        values[cells[:, 26] == 15] = 1
+        values[cells[:, 27] == 15] = -1
+        return values
+
+    def __call__(self, cells):
+        return self.evaluate(cells)
+
+
+_network = None
+
+
+def load_network(path=DEFAULT_PATH):
+    """Return the shared network for path, or None if there is no weights file."""
+    global _network
+    if _network is None or _network.path != path:
+        if not os.path.exists(path):
+            return None
+        _network = Network.load(path)
+    return _network
+
+
+def main():
+    from rollout import Playout
+    from OOP_Backgammon import Backgammon
+    from search_state import Position
+
+    network = load_network() or Network.random(seed=0)
+    game = Backgammon("White", "Black", "Random", "Random")
+    game.real_game = False
+    start = Position.from_game(game)
+    playout = Playout(seed=1)
+    positions = []
+    while len(positions) < 4096:
+        playout.play(start, max_plies=int(playout.random.random() * 60))
+        positions.append(playout.cells[:])
+    cells = np.array(positions, dtype=np.int8)
+
+    for size in (1, 64, 4096):
+        began = time.perf_counter()
+        repeats = 4096 // size
+        for i in range(repeats):
+            network.evaluate(cells[i * size : (i + 1) * size])
+        elapsed = time.perf_counter() - began
+        print(f"batch {size}: {4096 / elapsed:.0f} positions/s")
+
+
+if __name__ == "__main__":
+    main()
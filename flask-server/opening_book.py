@@ -0,0 +1,172 @@
+import argparse
+import os
+import struct
+import sys
+import time
+import numpy as np
+from search_state import Position
+from move_generator import legal_plays
+
+# Opening book file: a header, then fixed-size entries sorted by key. Each
+# entry maps (position key, dice) to up to four (start, end) moves, padded
+# with NO_MOVE.
+MAGIC = b"BGOB"
+VERSION = 1
+HEADER = struct.Struct("<4sHI")
+ENTRY = np.dtype([("key", "<u8"), ("dice", "u1"), ("moves", "u1", (8,))])
+NO_MOVE = 255
+DEFAULT_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "opening_book.bin"
+)
+BUILD_ITERATIONS = 10000
+
+
+def dice_code(rolls):
+    """0..35 code for a turn's rolls, the same for either order."""
+    return 6 * (max(rolls) - 1) + min(rolls) - 1
+
+
+class OpeningBook:
+    def __init__(self, path=DEFAULT_PATH):
+        with open(path, "rb") as handle:
+            data = handle.read()
+        magic, version, count = HEADER.unpack_from(data)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} opening book")
+        entries = np.frombuffer(data, dtype=ENTRY, count=count, offset=HEADER.size)
+        self.path = path
+        self.moves = {}
+        for key, dice, moves in entries.tolist():
+            self.moves[(key, dice)] = tuple(
+                (start, end)
+                for start, end in zip(moves[::2], moves[1::2])
+                if start != NO_MOVE
+            )
+
+    def lookup(self, key, rolls):
+        """The book's (start, end) moves for a position and rolls, or None."""
+        if not rolls:
+            return None
+        return self.moves.get((key, dice_code(rolls)))
+
+    def choose(self, game):
+        """The book play for game's position and rolls as a search result, or
+        None when the position is not in the book. Like possible_states, it
+        leaves the play in game.state_hash_to_move."""
+        from expectiminimax import Choice
+
+        position = Position.from_game(game)
+        moves = self.lookup(position.key, game.rolls)
+        if moves is None:
+            return None
+        for start, end in moves:
+            position.apply(start, end)
+        position.pass_turn()
+        game.state_hash_to_move = {position.key: moves}
+        return Choice(position, None)
+
+    def __len__(self):
+        return len(self.moves)
+
+
+_book = None
+
+
+def open_book(path=DEFAULT_PATH):
+    """Return the shared book for path, or None if it has not been built."""
+    global _book
+    if _book is None or _book.path != path:
+        if not os.path.exists(path):
+            return None
+        _book = OpeningBook(path)
+    return _book
+
+
+def write_book(moves, path=DEFAULT_PATH):
+    rows = []
+    for (key, dice), play in sorted(moves.items()):
+        padded = [point for move in play for point in move]
+        rows.append((key, dice, padded + [NO_MOVE] * (8 - len(padded))))
+    entries = np.array(rows, dtype=ENTRY)
+    with open(path, "wb") as handle:
+        handle.write(HEADER.pack(MAGIC, VERSION, len(entries)))
+        handle.write(entries.tobytes())
+
+
+def build(path=DEFAULT_PATH, iterations=BUILD_ITERATIONS, replies=True):
+    """Search every opening roll for both colors and, with replies, every roll
+    after each legal opening play, not just the book's, then write the book
+    to path."""
+    from OOP_Backgammon import Backgammon
+    from MCTS import MCTS
+
+    game = Backgammon("White", "Black", "Monte", "Monte")
+    game.real_game = False
+    engine = MCTS(iterations=iterations, early_stop=False, reuse=False)
+    moves = {}
+
+    def search(position, rolls):
+        if (position.key, dice_code(rolls)) in moves:
+            return
+        position.write_to(game)
+        game.current_turn = position.turn
+        game.rolls = rolls[:]
+        best = engine.search(game)
+        moves[(position.key, dice_code(rolls))] = game.state_hash_to_move[best.game.key]
+
+    start = Position.from_game(game)
+    for turn in (0, 1):
+        opening = start.copy()
+        if opening.turn != turn:
+            opening.pass_turn()
+        for roll1 in range(1, 7):
+            for roll2 in range(1, roll1):
+                search(opening, [roll1, roll2])
+                print(f"{'White' if turn == 0 else 'Black'} {roll1}-{roll2}")
+                if not replies:
+                    continue
+                for reply_from, _ in legal_plays(opening, [roll1, roll2]):
+                    for reply1 in range(1, 7):
+                        for reply2 in range(1, reply1 + 1):
+                            rolls = (
+                                [reply1] * 4 if reply1 == reply2 else [reply1, reply2]
+                            )
+                            search(reply_from, rolls)
+    write_book(moves, path)
+    return len(moves)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Opening book for the AI")
+    parser.add_argument("command", choices=["build", "info"])
+    parser.add_argument("--path", default=DEFAULT_PATH)
+    parser.add_argument("--iterations", type=int, default=BUILD_ITERATIONS)
+    parser.add_argument("--no-replies", action="store_true")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        began = time.perf_counter()
+        count = build(args.path, args.iterations, not args.no_replies)
+        print(
+            f"Wrote {count} entries to {args.path} "
+            f"in {time.perf_counter() - began:.0f}s"
+        )
+        return
+
+    book = open_book(args.path)
+    if book is None:
+        sys.exit(f"{args.path} not found, run `python opening_book.py build` first")
+    from OOP_Backgammon import Backgammon
+
+    game = Backgammon("White", "Black", "Monte", "Monte")
+    game.real_game = False
+    game.rolls = [3, 1]
+    began = time.perf_counter()
+    for _ in range(1000):
+        book.choose(game)
+    elapsed = time.perf_counter() - began
+    print(f"{len(book)} entries, {elapsed * 1000:.0f} us per lookup")
+
+
+if __name__ == "__main__":
+    main()
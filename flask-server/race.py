@@ -0,0 +1,130 @@
+import math
+import time
+from functools import lru_cache
+import numpy as np
+from search_state import Position, WHITE, TURN, SIZE
+from evaluator import side_views, pip_counts, is_contact
+from bearoff import bearing_off, open_database, side_counts, batch_index, SCALE
+
+# Average pips a roll is worth, counting doubles twice
+PIPS_PER_ROLL = 49 / 6
+# Standard deviation of the pip difference grows with sqrt(pips) by this much,
+# and being on roll is worth about half a roll
+SPREAD = 2.13
+ON_ROLL = 4
+
+
+def keith_wastage(view):
+    """Keith's adjustments to a side's pip count for a poor home board."""
+    own = np.maximum(view[:, :6], 0)
+    return (
+        2 * np.maximum(own[:, 0] - 1, 0)
+        + np.maximum(own[:, 1] - 1, 0)
+        + np.maximum(own[:, 2] - 3, 0)
+        + (own[:, 3:6] == 0).sum(axis=1)
+    )
+
+
+def effective_pips(cells, database=None):
+    """(white, black) effective pip counts for an (N, 29) batch.
+
+    A side with every checker home uses its expected rolls from the bear-off
+    database when there is one, otherwise the pip count plus Keith's wastage.
+    """
+    cells = np.asarray(cells, dtype=np.int32).reshape(-1, SIZE)
+    white_view, black_view = side_views(cells)
+    white = pip_counts(white_view, cells[:, 24]) + keith_wastage(white_view)
+    black = pip_counts(black_view, cells[:, 25]) + keith_wastage(black_view)
+    if database is not None:
+        rolls = np.arange(database.table.shape[1])
+        white_home = (cells[:, 6:24] >= 0).all(axis=1) & (cells[:, 24] == 0)
+        black_home = (cells[:, :18] <= 0).all(axis=1) & (cells[:, 25] == 0)
+        for pips, counts, home in zip(
+            (white, black), side_counts(cells), (white_home, black_home)
+        ):
+            if home.any():
+                table = database.table[batch_index(counts[home])] / SCALE
+                pips[home] = np.rint((table * rolls).sum(axis=1) * PIPS_PER_ROLL)
+    return white, black
+
+
+@lru_cache(maxsize=65536)
+def race_equity(roller, other):
+    """Chance that the side on roll wins a race, from effective pip counts."""
+    spread = SPREAD * math.sqrt(max((roller + other) / 2, 1))
+    return 0.5 * (1 + math.erf((other - roller + ON_ROLL) / (spread * math.sqrt(2))))
+
+
+def race_values(cells, database=None):
+    """White's value in [-1, 1] for an (N, 29) batch of races."""
+    cells = np.asarray(cells, dtype=np.int32).reshape(-1, SIZE)
+    white, black = effective_pips(cells, database)
+    white_roll = cells[:, TURN] == WHITE
+    values = np.empty(len(cells))
+    for i, (white_pips, black_pips, roll) in enumerate(
+        zip(white.tolist(), black.tolist(), white_roll.tolist())
+    ):
+        if roll:
+            values[i] = 2 * race_equity(white_pips, black_pips) - 1
+        else:
+            values[i] = 1 - 2 * race_equity(black_pips, white_pips)
+    if database is not None:
+        home = bearing_off(cells)
+        if home.any():
+            values[home] = database.values(cells[home])
+    values[cells[:, 26] == 15] = 1
+    values[cells[:, 27] == 15] = -1
+    return values
+
+
+class Race:
+    """One-ply engine for positions where neither side can hit again.
+
+    Plays are scored with the bear-off database once both sides are home and
+    with effective pip counts before that.
+    """
+
+    def __init__(self, database=None):
+        self.database = open_database() if database is None else database
+
+    def search(self, inital_state):
+        from expectiminimax import Choice
+
+        states = list(inital_state.possible_states())
+        values = race_values([state.cells for state in states], self.database)
+        # The mover is the side not to move in the resulting positions
+        sign = -1 if states[0].turn == WHITE else 1
+        best = int(np.argmax(sign * values))
+        return Choice(states[best], float(values[best]))
+
+
+def main():
+    from rollout import Playout, ROLLS
+    from OOP_Backgammon import Backgammon
+    from MCTS import MCTS
+
+    game = Backgammon("White", "Black", "Monte", "Monte")
+    game.real_game = False
+    start = Position.from_game(game)
+    playout = Playout(seed=1)
+    races = []
+    while len(races) < 10:
+        # Stop random games partway and keep the ones that became races
+        playout.play(start, max_plies=40 + int(playout.random.random() * 40))
+        cells = playout.cells
+        if not is_contact(np.array([cells]))[0] and max(cells[26:28]) < 15:
+            races.append(Position(type(start.cells)("b", cells)))
+
+    for name, engine in (("MCTS", MCTS(reuse=False)), ("Race", Race())):
+        began = time.perf_counter()
+        for i, position in enumerate(races):
+            position.write_to(game)
+            game.current_turn = position.turn
+            game.rolls = ROLLS[i * 7 % 36][:]
+            engine.search(game)
+        elapsed = time.perf_counter() - began
+        print(f"{name}: {elapsed / len(races) * 1000:.1f} ms per late-game AI turn")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,307 @@
+import random
+import time
+import numpy as np
+from search_state import Position, WHITE, BLACK, TURN, SIZE
+from move_generator import batch_move_mask
+from bearoff import bearing_off
+
+MAX_PLIES = 2000
+ROLLS = [
+    [roll1, roll2] * 2 if roll1 == roll2 else [roll1, roll2]
+    for roll1 in range(1, 7)
+    for roll2 in range(1, 7)
+]
+
+
+class Playout:
+    """Random playouts on a plain list of ints with their own RNG.
+
+    The policy is the one Backgammon.play_turn uses: a start is picked
+    uniformly among the starts with a legal move, then an end uniformly among
+    that start's moves, until the dice run out or nothing can move.
+    With stop_at_bearoff, play stops (returning None) once both sides are
+    bearing off, so the bear-off database can finish the game.
+    """
+
+    def __init__(self, seed=None, max_plies=MAX_PLIES, stop_at_bearoff=False):
+        self.random = random.Random(seed)
+        self.max_plies = max_plies
+        self.stop_at_bearoff = stop_at_bearoff
+        self.cells = None
+        self.plies = 0
+        # Whether each side could bear off the last time choices looked
+        self.home = [False, False]
+
+    def play(self, position, max_plies=None):
+        """Play position out. Returns the winner, or None if the cap was hit."""
+        cells = self.cells = list(position.cells)
+        self.plies = 0
+        if cells[26] == 15 or cells[27] == 15:
+            return position.winner()
+        rand = self.random.random
+        turn = cells[TURN]
+        limit = self.max_plies if max_plies is None else max_plies
+        stop = self.stop_at_bearoff
+        if stop and self.bearing_off(cells):
+            return None
+        home = self.home
+        home[WHITE] = home[BLACK] = False
+        while self.plies < limit:
+            if stop and home[WHITE] and home[BLACK] and self.bearing_off(cells):
+                break
+            rolls = ROLLS[int(rand() * 36)][:]
+            while rolls:
+                choices = self.choices(cells, turn, rolls)
+                if not choices:
+                    break
+                start, ends = choices[int(rand() * len(choices))]
+                end = list(ends)[int(rand() * len(ends))]
+                rolls.remove(ends[end])
+                if self.move(cells, turn, start, end):
+                    cells[TURN] = turn
+                    self.plies += 1
+                    return turn
+            turn ^= 1
+            self.plies += 1
+        cells[TURN] = turn
+        return None
+
+    def bearing_off(self, cells):
+        return (
+            not cells[24]
+            and not cells[25]
+            and min(cells[6:24]) >= 0
+            and max(cells[:18]) <= 0
+        )
+
+    def choices(self, cells, turn, rolls):
+        """Return [(start, {end: roll})] for every start with a legal move."""
+        dice = rolls[:1] if rolls[0] == rolls[-1] else rolls
+        choices = []
+        if turn == WHITE:
+            if cells[24]:
+                ends = {}
+                for roll in dice:
+                    if cells[24 - roll] <= 1:
+                        ends[24 - roll] = roll
+                self.home[WHITE] = False
+                return [(24, ends)] if ends else choices
+            highest = 23
+            while highest >= 0 and cells[highest] >= 0:
+                highest -= 1
+            bear_off = self.home[WHITE] = highest < 6
+            for start in range(highest + 1):
+                if cells[start] >= 0:
+                    continue
+                ends = {}
+                for roll in dice:
+                    end = start - roll
+                    if end >= 0:
+                        if cells[end] <= 1:
+                            ends[end] = roll
+                    elif bear_off and (end == -1 or start == highest):
+                        ends[26] = roll
+                if ends:
+                    choices.append((start, ends))
+        else:
+            if cells[25]:
+                ends = {}
+                for roll in dice:
+                    if cells[roll - 1] >= -1:
+                        ends[roll - 1] = roll
+                self.home[BLACK] = False
+                return [(25, ends)] if ends else choices
+            lowest = 0
+            while lowest <= 23 and cells[lowest] <= 0:
+                lowest += 1
+            bear_off = self.home[BLACK] = lowest > 17
+            for start in range(lowest, 24):
+                if cells[start] <= 0:
+                    continue
+                ends = {}
+                for roll in dice:
+                    end = start + roll
+                    if end <= 23:
+                        if cells[end] >= -1:
+                            ends[end] = roll
+                    elif bear_off and (end == 24 or start == lowest):
+                        ends[27] = roll
+                if ends:
+                    choices.append((start, ends))
+        return choices
+
+    def move(self, cells, turn, start, end):
+        """Apply one move and return True when it bears off the last checker."""
+        if turn == WHITE:
+            if start == 24:
+                cells[24] -= 1
+            else:
+                cells[start] += 1
+            if end == 26:
+                cells[26] += 1
+                return cells[26] == 15
+            if cells[end] == 1:
+                cells[end] = -1
+                cells[25] += 1
+            else:
+                cells[end] -= 1
+        else:
+            if start == 25:
+                cells[25] -= 1
+            else:
+                cells[start] -= 1
+            if end == 27:
+                cells[27] += 1
+                return cells[27] == 15
+            if cells[end] == -1:
+                cells[end] = 1
+                cells[24] += 1
+            else:
+                cells[end] += 1
+        return False
+
+
+class BatchPlayout:
+    """Lock-step random playouts: one sub-move for every running game per step.
+
+    Uses the same random policy as Playout, with legality computed for the
+    whole batch by batch_move_mask.
+    """
+
+    def __init__(self, seed=None, max_plies=MAX_PLIES, stop_at_bearoff=False):
+        self.random = np.random.default_rng(seed)
+        self.max_plies = max_plies
+        self.stop_at_bearoff = stop_at_bearoff
+        self.cells = None
+        self.plies = None
+
+    def play(self, positions, max_plies=None):
+        """Play every position out. Returns winners (0/1, -1 at the cap)."""
+        cells = np.array([position.cells for position in positions], dtype=np.int16)
+        cells = cells.reshape(-1, SIZE)
+        self.cells = cells
+        count = len(cells)
+        limit = self.max_plies if max_plies is None else max_plies
+        winners = np.full(count, -1, dtype=np.int8)
+        winners[cells[:, 26] == 15] = WHITE
+        winners[cells[:, 27] == 15] = BLACK
+        running = winners < 0
+        if self.stop_at_bearoff:
+            running &= ~bearing_off(cells)
+        plies = self.plies = np.zeros(count, dtype=np.int32)
+        dice = np.zeros((count, 4), dtype=np.int16)
+        self.roll(dice, running)
+        while running.any():
+            rows = np.flatnonzero(running)
+            # Only the first two dice slots are distinct: doubles are used up
+            # from the back, so slots 0 and 1 always hold what is left.
+            legal, starts, ends = batch_move_mask(cells[rows], dice[rows, :2])
+
+            # Like the dict in Board.possible_moves, when both dice reach the
+            # same end the later die is the one used.
+            first = legal[:, :, 0] & ~(
+                legal[:, :, 1] & (ends[:, :, 0] == ends[:, :, 1])
+            )
+            second = legal[:, :, 1]
+            movable = first | second
+            moving = movable.any(axis=1)
+
+            start_keys = np.where(movable, self.random.random(movable.shape), -1)
+            start_slots = start_keys.argmax(axis=1)
+            choice = np.arange(len(rows))
+            options = np.stack(
+                [first[choice, start_slots], second[choice, start_slots]], axis=1
+            )
+            die_keys = np.where(options, self.random.random(options.shape), -1)
+            die_slots = die_keys.argmax(axis=1)
+
+            mover_rows = rows[moving]
+            choice = choice[moving]
+            start_slots = start_slots[moving]
+            die_slots = die_slots[moving]
+            start = starts[choice, start_slots, die_slots]
+            end = ends[choice, start_slots, die_slots]
+            white = cells[mover_rows, TURN] == WHITE
+            sign = np.where(white, -1, 1)
+            cells[mover_rows, start] += np.where(start >= 24, -1, -sign)
+            on_point = end < 24
+            hit = on_point & (cells[mover_rows, np.where(on_point, end, 0)] == -sign)
+            cells[mover_rows, end] += np.where(
+                on_point, np.where(hit, 2 * sign, sign), 1
+            )
+            cells[mover_rows, np.where(white, 25, 24)] += hit
+            doubles = dice[mover_rows, 0] == dice[mover_rows, 1]
+            used = np.where(
+                doubles, np.count_nonzero(dice[mover_rows], axis=1) - 1, die_slots
+            )
+            dice[mover_rows, used] = 0
+
+            won = cells[mover_rows, np.where(white, 26, 27)] == 15
+            winners[mover_rows[won]] = cells[mover_rows[won], TURN]
+            running[mover_rows[won]] = False
+            plies[mover_rows[won]] += 1
+
+            dice[rows[~moving]] = 0
+            finished = running & (dice[:, 0] == 0) & (dice[:, 1] == 0)
+            cells[finished, TURN] ^= 1
+            plies[finished] += 1
+            running &= plies < limit
+            if self.stop_at_bearoff and finished.any():
+                turned = np.flatnonzero(finished)
+                running[turned[bearing_off(cells[turned])]] = False
+            self.roll(dice, finished & running)
+        return winners
+
+    def roll(self, dice, rows):
+        count = int(rows.sum())
+        rolls = self.random.integers(1, 7, size=(count, 2))
+        doubles = rolls[:, 0] == rolls[:, 1]
+        dice[rows] = np.where(
+            doubles[:, None],
+            rolls[:, [0, 0, 0, 0]],
+            np.concatenate([rolls, np.zeros((count, 2), dtype=rolls.dtype)], axis=1),
+        )
+
+
+def main():
+    from OOP_Backgammon import Backgammon
+
+    game = Backgammon("White", "Black", "Random", "Random")
+    game.real_game = False
+    start = Position.from_game(game)
+    games = 2000
+
+    playout = Playout(seed=1)
+    began = time.perf_counter()
+    white_wins = sum(playout.play(start) == WHITE for _ in range(games))
+    elapsed = time.perf_counter() - began
+    print(
+        f"Playout: {games / elapsed:.0f} playouts/s, White wins {white_wins / games:.3f}"
+    )
+
+    batch_playout = BatchPlayout(seed=1)
+    began = time.perf_counter()
+    white_wins = (batch_playout.play([start] * games) == WHITE).sum()
+    elapsed = time.perf_counter() - began
+    print(
+        f"BatchPlayout: {games / elapsed:.0f} playouts/s, "
+        f"White wins {white_wins / games:.3f}"
+    )
+
+    began = time.perf_counter()
+    white_wins = 0
+    for _ in range(games // 10):
+        start.write_to(game)
+        game.current_turn = BLACK if start.turn == WHITE else WHITE
+        game.rolls = []
+        game.start_game()
+        white_wins += game.current_turn == WHITE
+    elapsed = time.perf_counter() - began
+    print(
+        f"Backgammon.start_game: {games // 10 / elapsed:.0f} playouts/s, "
+        f"White wins {white_wins / (games // 10):.3f}"
+    )
+
+
+if __name__ == "__main__":
+    main()
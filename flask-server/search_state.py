@@ -0,0 +1,219 @@
+from array import array
+import random
+
+# Cell layout of a Position. Points use the Board convention (Black positive,
+# White negative); bar and off counts are stored as positive numbers.
+WHITE = 0
+BLACK = 1
+WHITE_BAR = 24
+BLACK_BAR = 25
+WHITE_OFF = 26
+BLACK_OFF = 27
+TURN = 28
+SIZE = 29
+
+# Zobrist keys per cell and count (offset by 15). The seed is fixed so keys
+# agree across processes and with anything stored on disk. Empty cells and
+# White to move hash to 0.
+_zobrist = random.Random(0x5EED)
+CELL_KEYS = [
+    [0 if count == 15 else _zobrist.getrandbits(64) for count in range(31)]
+    for cell in range(SIZE)
+]
+
+
+def cells_key(cells):
+    key = 0
+    for cell, count in enumerate(cells):
+        key ^= CELL_KEYS[cell][count + 15]
+    return key
+
+
+class Position:
+    """Compact search position: 24 points, bars, offs and the side to move."""
+
+    __slots__ = ("cells", "key")
+
+    def __init__(self, cells=None, key=None):
+        if cells is None:
+            cells = array("b", bytes(SIZE))
+        self.cells = cells
+        self.key = cells_key(cells) if key is None else key
+
+    @classmethod
+    def from_game(cls, game):
+        cells = array("b", bytes(SIZE))
+        for point, count in enumerate(game.game_board.board.tolist()):
+            cells[point] = count
+        cells[WHITE_BAR] = game.players[0].num_dead_pieces
+        cells[BLACK_BAR] = game.players[1].num_dead_pieces
+        cells[WHITE_OFF] = game.players[0].num_home_pieces
+        cells[BLACK_OFF] = game.players[1].num_home_pieces
+        cells[TURN] = game.current_turn
+        return cls(cells)
+
+    def write_to(self, game):
+        """Copy points, bar and off counts into game. The turn is left alone."""
+        cells = self.cells
+        game.game_board.board[:] = cells[:24]
+        game.game_board.recount()
+        game.players[0].num_dead_pieces = cells[WHITE_BAR]
+        game.players[1].num_dead_pieces = cells[BLACK_BAR]
+        game.players[0].num_home_pieces = cells[WHITE_OFF]
+        game.players[1].num_home_pieces = cells[BLACK_OFF]
+        game.board_key = self.key ^ CELL_KEYS[TURN][cells[TURN] + 15]
+
+    def copy(self):
+        return Position(self.cells[:], self.key)
+
+    @property
+    def turn(self):
+        return self.cells[TURN]
+
+    def pass_turn(self):
+        self.add(TURN, 1 - 2 * self.cells[TURN])
+
+    def add(self, cell, delta):
+        """Change one cell by delta, keeping the Zobrist key up to date."""
+        keys = CELL_KEYS[cell]
+        old = self.cells[cell]
+        self.cells[cell] = old + delta
+        self.key ^= keys[old + 15] ^ keys[old + delta + 15]
+
+    def moves_for_die(self, die):
+        """Return the (start, end) moves the side to move has for one die."""
+        cells = self.cells
+        moves = []
+        if cells[TURN] == WHITE:
+            if cells[WHITE_BAR] > 0:
+                if cells[24 - die] <= 1:
+                    moves.append((WHITE_BAR, 24 - die))
+                return moves
+            highest = -1
+            for start in range(24):
+                if cells[start] < 0:
+                    highest = start
+            bear_off = highest < 6
+            for start in range(highest + 1):
+                if cells[start] >= 0:
+                    continue
+                end = start - die
+                if end >= 0:
+                    if cells[end] <= 1:
+                        moves.append((start, end))
+                elif bear_off and (end == -1 or start == highest):
+                    moves.append((start, WHITE_OFF))
+        else:
+            if cells[BLACK_BAR] > 0:
+                if cells[die - 1] >= -1:
+                    moves.append((BLACK_BAR, die - 1))
+                return moves
+            lowest = 24
+            for start in range(23, -1, -1):
+                if cells[start] > 0:
+                    lowest = start
+            bear_off = lowest > 17
+            for start in range(lowest, 24):
+                if cells[start] <= 0:
+                    continue
+                end = start + die
+                if end <= 23:
+                    if cells[end] >= -1:
+                        moves.append((start, end))
+                elif bear_off and (end == 24 or start == lowest):
+                    moves.append((start, BLACK_OFF))
+        return moves
+
+    def apply(self, start, end):
+        """Move one checker for the side to move and return the undo record."""
+        cells = self.cells
+        hit = False
+        if cells[TURN] == WHITE:
+            if start == WHITE_BAR:
+                self.add(WHITE_BAR, -1)
+            else:
+                self.add(start, 1)
+            if end == WHITE_OFF:
+                self.add(WHITE_OFF, 1)
+            elif cells[end] == 1:
+                self.add(end, -2)
+                self.add(BLACK_BAR, 1)
+                hit = True
+            else:
+                self.add(end, -1)
+        else:
+            if start == BLACK_BAR:
+                self.add(BLACK_BAR, -1)
+            else:
+                self.add(start, -1)
+            if end == BLACK_OFF:
+                self.add(BLACK_OFF, 1)
+            elif cells[end] == -1:
+                self.add(end, 2)
+                self.add(WHITE_BAR, 1)
+                hit = True
+            else:
+                self.add(end, 1)
+        return (start, end, hit)
+
+    def undo(self, record):
+        start, end, hit = record
+        if self.cells[TURN] == WHITE:
+            if end == WHITE_OFF:
+                self.add(WHITE_OFF, -1)
+            elif hit:
+                self.add(end, 2)
+                self.add(BLACK_BAR, -1)
+            else:
+                self.add(end, 1)
+            if start == WHITE_BAR:
+                self.add(WHITE_BAR, 1)
+            else:
+                self.add(start, -1)
+        else:
+            if end == BLACK_OFF:
+                self.add(BLACK_OFF, -1)
+            elif hit:
+                self.add(end, -2)
+                self.add(WHITE_BAR, -1)
+            else:
+                self.add(end, -1)
+            if start == BLACK_BAR:
+                self.add(BLACK_BAR, 1)
+            else:
+                self.add(start, 1)
+
+    def check_winner(self):
+        return self.cells[WHITE_OFF] == 15 or self.cells[BLACK_OFF] == 15
+
+    def winner(self):
+        if self.cells[WHITE_OFF] == 15:
+            return WHITE
+        if self.cells[BLACK_OFF] == 15:
+            return BLACK
+        return None
+
+    def __hash__(self):
+        return self.key
+
+    def __eq__(self, other):
+        if not isinstance(other, Position):
+            return False
+        return self.cells == other.cells
+
+    def __str__(self):
+        cells = self.cells
+        top_row = " | ".join(
+            f"{abs(cell)}{'W' if cell < 0 else 'B' if cell > 0 else ' '}"
+            for cell in cells[:12]
+        )
+        bottom_row = " | ".join(
+            f"{abs(cell)}{'W' if cell < 0 else 'B' if cell > 0 else ' '}"
+            for cell in reversed(cells[12:24])
+        )
+        return (
+            f"Turn: {'White' if cells[TURN] == WHITE else 'Black'}\n"
+            f"Bar W/B: {cells[WHITE_BAR]}/{cells[BLACK_BAR]} | "
+            f"Off W/B: {cells[WHITE_OFF]}/{cells[BLACK_OFF]}\n"
+            f"  {top_row}\n  {bottom_row}\n"
+        )
@@ -0,0 +1,167 @@
+import argparse
+import os
+import random
+import struct
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from search_state import Position, WHITE, BLACK, SIZE
+from neural import Network, encode, load_network, DEFAULT_PATH, HIDDEN
+
+# Self-play buffer: a header, then fixed-size records appended as games
+# finish. Each record is a position (Position cells, side to move included)
+# and the outcome of its game: the winner, plus GAMMON if the loser had
+# borne off no checkers.
+MAGIC = b"BGSP"
+VERSION = 1
+HEADER = struct.Struct("<4sHH")
+RECORD = np.dtype([("cells", "i1", (SIZE,)), ("outcome", "i1")])
+GAMMON = 2
+DEFAULT_BUFFER = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "self_play.bin"
+)
+MAX_PLIES = 1000
+
+
+def append_records(path, records):
+    """Append records to the buffer at path, writing the header first if new.
+    Nothing is written when there are no records."""
+    if len(records) == 0:
+        return
+    new = not os.path.exists(path) or os.path.getsize(path) == 0
+    with open(path, "ab") as handle:
+        if new:
+            handle.write(HEADER.pack(MAGIC, VERSION, RECORD.itemsize))
+        handle.write(records.tobytes())
+
+
+def read_records(path, window=None):
+    """The last window records of the buffer at path (all of them by default)."""
+    with open(path, "rb") as handle:
+        magic, version, size = HEADER.unpack(handle.read(HEADER.size))
+    if magic != MAGIC or version != VERSION or size != RECORD.itemsize:
+        raise ValueError(f"{path} is not a version {VERSION} self-play buffer")
+    if os.path.getsize(path) == HEADER.size:
+        return np.zeros(0, dtype=RECORD)
+    records = np.memmap(path, dtype=RECORD, mode="r", offset=HEADER.size)
+    if window is not None:
+        records = records[-window:]
+    return np.array(records)
+
+
+def targets(outcomes):
+    """(N, 3) network targets: White wins, White gammons, Black gammons."""
+    winners = outcomes & 1
+    gammons = (outcomes & GAMMON) > 0
+    return np.stack(
+        [winners == WHITE, gammons & (winners == WHITE), gammons & (winners == BLACK)],
+        axis=1,
+    ).astype(np.float32)
+
+
+def play_games(layers, games, seed, epsilon):
+    """Play games with the network choosing greedily (or at random with
+    probability epsilon). Returns the records of every finished game."""
+    from OOP_Backgammon import Backgammon, Dice
+
+    random.seed(seed)
+    network = Network(layers)
+    game = Backgammon("White", "Black", "Neural", "Neural")
+    game.real_game = False
+    start = Position.from_game(game)
+    records = []
+    for _ in range(games):
+        start.write_to(game)
+        game.current_turn = random.randrange(2)
+        positions = []
+        while not game.check_winner() and len(positions) < MAX_PLIES:
+            roll1, roll2 = Dice.roll_dice()
+            game.rolls = [roll1, roll2] * 2 if roll1 == roll2 else [roll1, roll2]
+            states = game.possible_states()
+            if random.random() < epsilon:
+                state = random.choice(states)
+            else:
+                values = network.evaluate([state.cells for state in states])
+                sign = 1 if game.current_turn == WHITE else -1
+                state = states[int(np.argmax(sign * values))]
+            state.write_to(game)
+            game.current_turn = state.turn
+            positions.append(state.cells)
+        winner = state.winner()
+        if winner is None:
+            continue
+        outcome = winner | (GAMMON if state.cells[27 - winner] == 0 else 0)
+        game_records = np.empty(len(positions), dtype=RECORD)
+        game_records["cells"] = positions
+        game_records["outcome"] = outcome
+        records.append(game_records)
+    return np.concatenate(records) if records else np.empty(0, dtype=RECORD)
+
+
+def train(network, records, epochs, batch_size, rate, rng):
+    """Supervised updates towards the game outcomes. Returns the mean loss."""
+    inputs = encode(records["cells"])
+    goals = targets(records["outcome"])
+    losses = []
+    for _ in range(epochs):
+        order = rng.permutation(len(records))
+        for begin in range(0, len(order), batch_size):
+            rows = order[begin : begin + batch_size]
+            losses.append(network.train(inputs[rows], goals[rows], rate))
+    return float(np.mean(losses)) if losses else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Self-play training")
+    parser.add_argument("--rounds", type=int, default=100)
+    parser.add_argument("--games", type=int, default=64, help="games per round")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--weights", default=DEFAULT_PATH)
+    parser.add_argument("--buffer", default=DEFAULT_BUFFER)
+    parser.add_argument("--window", type=int, default=200000)
+    parser.add_argument("--epochs", type=int, default=1)
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--rate", type=float, default=0.1)
+    parser.add_argument("--epsilon", type=float, default=0.05)
+    parser.add_argument("--hidden", type=int, nargs="+", default=list(HIDDEN))
+    parser.add_argument("--checkpoint-every", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    network = load_network(args.weights) or Network.random(args.hidden, args.seed)
+    rng = np.random.default_rng(args.seed)
+    share = -(-args.games // args.workers)
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        for number in range(1, args.rounds + 1):
+            began = time.perf_counter()
+            seeds = [
+                args.seed * 1000003 + number * args.workers + worker
+                for worker in range(args.workers)
+            ]
+            results = pool.map(
+                play_games,
+                [network.layers] * args.workers,
+                [share] * args.workers,
+                seeds,
+                [args.epsilon] * args.workers,
+            )
+            records = np.concatenate(list(results))
+            append_records(args.buffer, records)
+            played = time.perf_counter() - began
+
+            began = time.perf_counter()
+            window = read_records(args.buffer, args.window)
+            loss = train(network, window, args.epochs, args.batch_size, args.rate, rng)
+            trained = time.perf_counter() - began
+            print(
+                f"round {number}: {share * args.workers / played:.1f} games/s, "
+                f"{len(records) / played:.0f} positions/s played, "
+                f"{len(window) * args.epochs / trained:.0f} positions/s trained, "
+                f"loss {loss:.4f}"
+            )
+            if number % args.checkpoint_every == 0 or number == args.rounds:
+                network.save(args.weights)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,7 +2,10 @@ from flask import Flask, jsonify, request, session
 from flask_cors import CORS
 from flask_socketio import SocketIO, join_room, leave_room, rooms
 from OOP_Backgammon import Backgammon, Dice, Board
-import sqlite3
+from game_cache import GameCache
+from storage import Storage
+import codec
+import atexit
 import random
 import string
 import json
@@ -30,52 +33,38 @@ def generate_game_code(length=6):
 # Database Functions
 
 
+# Registered before the game cache, so it runs after the final flush
+storage = Storage()
+atexit.register(storage.close)
+
+
 def init_db():
-    conn = sqlite3.connect("games.db")
-    cursor = conn.cursor()
-    cursor.execute(
-        """
-        CREATE TABLE IF NOT EXISTS games (
-            game_id TEXT PRIMARY KEY,
-            game_data TEXT
-        )
-    """
-    )
-    conn.commit()
-    conn.close()
+    storage.init()
 
 
 init_db()
 
 
 def save_game(game_id, game_data):
-    conn = sqlite3.connect("games.db")
-    cursor = conn.cursor()
-    cursor.execute(
-        "INSERT OR REPLACE INTO games (game_id, game_data) VALUES (?, ?)",
-        (game_id, game_data),
-    )
-    conn.commit()
-    conn.close()
+    storage.save(game_id, game_data)
 
 
 def load_game(game_id):
-    conn = sqlite3.connect("games.db")
-    cursor = conn.cursor()
-    cursor.execute("SELECT game_data FROM games WHERE game_id = ?", (game_id,))
-    row = cursor.fetchone()
-    conn.close()
-    return row[0] if row else None
+    return storage.load(game_id)
+
+
+# Games stay in memory, encoded, between events and are written behind
+games = GameCache(load_game, save_game, codec.encode, codec.decode, codec.open_view)
+games.start()
 
 
 # OOP_Backgammon Functions
 
 
 def process_state(game_id):
-    game_data = load_game(game_id)
-    if not game_data:
+    game = games.view(game_id)
+    if game is None:
         return {"error": "Game not found"}, 404
-    game = Backgammon.from_json(game_data)
     return {
         "current_turn": game.players[game.current_turn].name,
         "rolls": game.rolls,
@@ -85,10 +74,9 @@ def process_state(game_id):
 
 
 def process_pick_state(game_id, start):
-    game_data = load_game(game_id)
-    if not game_data:
+    game = games.get(game_id)
+    if game is None:
         return {"error": "Game not found"}, 404
-    game = Backgammon.from_json(game_data)
     if start is None:
         return {"error": "Position is required"}, 400
     check = game.pick_start(start)
@@ -102,29 +90,24 @@ def process_pick_state(game_id, start):
 
 
 def process_roll_dice(game_id):
-    game_data = load_game(game_id)
-    if not game_data:
+    game = games.get(game_id)
+    if game is None:
         return {"error": "Game not found"}, 404
-    game = Backgammon.from_json(game_data)
     if game.rolls == [] and not game.end_of_turn:
         roll1, roll2 = Dice.roll_dice()
         game.rolls = [roll1, roll2] * 2 if roll1 == roll2 else [roll1, roll2]
-        game.history = []
-        game.history_pointer = -1
-        game.save_state()
-        save_game(game_id, game.to_json())
+        game.start_history()
+        games.put(game_id, game)
         return {"message": "Dice rolled", "rolls": game.rolls}, 200
     else:
         return {"message": "Rolls already available", "rolls": game.rolls}, 200
 
 
 def process_make_move(game_id, start, end):
-    game_data = load_game(game_id)
-    if not game_data:
+    game = games.get(game_id)
+    if game is None:
         return {"error": "Game not found"}, 404
 
-    game = Backgammon.from_json(game_data)
-
     if not game.rolls:
         return {"error": "Roll the dice first!"}, 400
 
@@ -136,7 +119,7 @@ def process_make_move(game_id, start, end):
         return {"error": "Invalid move!"}, 400
 
     game.make_move(start, end, possible_moves)
-    save_game(game_id, game.to_json())
+    games.put(game_id, game)
     return {
         "message": f"Move made from {start} to {end}",
         "current_turn": game.players[game.current_turn].name,
@@ -146,10 +129,9 @@ def process_make_move(game_id, start, end):
 
 
 def process_ai_play(game_id):
-    game_data = load_game(game_id)
-    if not game_data:
+    game = games.get(game_id)
+    if game is None:
         return jsonify({"error": "Game not found"}), 404
-    game = Backgammon.from_json(game_data)
     while game.rolls != []:
         # profiler = cProfile.Profile()
         # profiler.enable()
@@ -158,7 +140,7 @@ def process_ai_play(game_id):
         # stats = pstats.Stats(profiler)
         # stats.strip_dirs().sort_stats('cumulative').print_stats(20)
     game.current_turn = (game.current_turn + 1) % 2
-    save_game(game_id, game.to_json())
+    games.put(game_id, game)
     return {
         "message": "AI Player",
         "current_turn": game.players[game.current_turn].name,
@@ -168,12 +150,11 @@ def process_ai_play(game_id):
 
 
 def process_is_possible_move(game_id):
-    game_data = load_game(game_id)
-    if not game_data:
+    game = games.get(game_id)
+    if game is None:
         return {"error": "Game not found"}, 404
-    game = Backgammon.from_json(game_data)
     game.is_possible_move()
-    save_game(game_id, game.to_json())
+    games.put(game_id, game)
     return {
         "message": game.message,
         "rolls": game.rolls,
@@ -182,10 +163,9 @@ def process_is_possible_move(game_id):
 
 
 def process_check_winner(game_id):
-    game_data = load_game(game_id)
-    if not game_data:
+    game = games.view(game_id)
+    if game is None:
         return {"error": "Game not found"}, 404
-    game = Backgammon.from_json(game_data)
     game.check_winner()
     return {
         "message": game.message,
@@ -195,12 +175,11 @@ def process_check_winner(game_id):
 
 
 def process_undo(game_id):
-    game_data = load_game(game_id)
-    if not game_data:
+    game = games.get(game_id)
+    if game is None:
         return {"error": "Game not found"}, 404
-    game = Backgammon.from_json(game_data)
     game.undo()
-    save_game(game_id, game.to_json())
+    games.put(game_id, game)
     return {
         "current_turn": game.players[game.current_turn].name,
         "rolls": game.rolls,
@@ -209,12 +188,11 @@ def process_undo(game_id):
 
 
 def process_redo(game_id):
-    game_data = load_game(game_id)
-    if not game_data:
+    game = games.get(game_id)
+    if game is None:
         return {"error": "Game not found"}, 404
-    game = Backgammon.from_json(game_data)
     game.redo()
-    save_game(game_id, game.to_json())
+    games.put(game_id, game)
     return {
         "current_turn": game.players[game.current_turn].name,
         "rolls": game.rolls,
@@ -223,26 +201,24 @@ def process_redo(game_id):
 
 
 def process_change_turn(game_id):
-    game_data = load_game(game_id)
-    if not game_data:
+    game = games.get(game_id)
+    if game is None:
         return {"error": "Game not found"}, 404
-    game = Backgammon.from_json(game_data)
     game.change_turn()
-    save_game(game_id, game.to_json())
+    games.put(game_id, game)
     return {
         "current_turn": game.players[game.current_turn].name,
     }, 200
 
 
 def process_restart_game(game_id):
-    game_data = load_game(game_id)
-    if not game_data:
+    game = games.get(game_id)
+    if game is None:
         return {"error": "Game not found"}, 404
-    game = Backgammon.from_json(game_data)
     game.num_restarts += 1
     if game.num_restarts == 2:
         game.restart_game()
-        save_game(game_id, game.to_json())
+        games.put(game_id, game)
         return {
             "game": "game restarted",
             "current_turn": game.players[game.current_turn].name,
@@ -250,7 +226,7 @@ def process_restart_game(game_id):
             "checkers_location": [checker.to_dict() for checker in game.checkers],
             "num_restarts": game.num_restarts,
         }, 200
-    save_game(game_id, game.to_json())
+    games.put(game_id, game)
     return {
         "game": "game not restarted yet",
         "current_turn": game.players[game.current_turn].name,
@@ -261,12 +237,11 @@ def process_restart_game(game_id):
 
 
 def auto_restart_game(game_id):
-    game_data = load_game(game_id)
-    if not game_data:
+    game = games.get(game_id)
+    if game is None:
         return {"error": "Game not found"}, 404
-    game = Backgammon.from_json(game_data)
     game.restart_game()
-    save_game(game_id, game.to_json())
+    games.put(game_id, game)
     return {
         "game": "game restarted",
         "current_turn": game.players[game.current_turn].name,
@@ -277,10 +252,9 @@ def auto_restart_game(game_id):
 
 
 def process_fetch_color(game_id):
-    game_data = load_game(game_id)
-    if not game_data:
+    game = games.view(game_id)
+    if game is None:
         return {"error": "Game not found"}, 404
-    game = Backgammon.from_json(game_data)
     return {
         "current_turn": game.players[0].name,
         "current_color": game.players[0].color,
@@ -313,7 +287,7 @@ def startvsAI():
         return jsonify({"error": "Missing 'name' field"}), 400
     game_id = generate_game_code()
     game = Backgammon(name1="AI", name2=player_name, AI1="Monte", AI2="User")
-    save_game(game_id, game.to_json())
+    games.add(game_id, game)
     return jsonify({"message": "Game started", "game_id": game_id}), 200
 
 
@@ -330,7 +304,7 @@ def startvsUser():
     game = Backgammon(
         name1=player_one_name, name2=player_two_name, AI1="User", AI2="User"
     )
-    save_game(game_id, game.to_json())
+    games.add(game_id, game)
     return jsonify({"message": "Game started", "game_id": game_id}), 200
 
 
@@ -475,7 +449,7 @@ def handle_create_local_game(data):
     game_id = generate_game_code()
     join_room(game_id)
     game = Backgammon(name1="AI", name2=player_one_name, AI1="Monte", AI2="User")
-    save_game(game_id, game.to_json())
+    games.add(game_id, game)
     socketio.emit(
         "ai_game_created",
         {"game_id": game_id, "message": "ai game created"},
@@ -496,7 +470,7 @@ def handle_create_local_game(data):
     game = Backgammon(
         name1=player_one_name, name2=player_two_name, AI1="User", AI2="User"
     )
-    save_game(game_id, game.to_json())
+    games.add(game_id, game)
     socketio.emit(
         "local_game_created",
         {"game_id": game_id, "message": "Local game created"},
@@ -516,6 +490,9 @@ def handle_join_game(data):
     if not game_data:
         socketio.emit("error", {"message": "Game not found"})
         return
+    if not codec.is_legacy(game_data):
+        socketio.emit("error", {"message": "Game is already full"})
+        return
     game = json.loads(game_data)
     print(game)
     if game["player_two"] is not None:
@@ -543,7 +520,7 @@ def handle_join_game(data):
         AI1="User",
         AI2="User",
     )
-    save_game(game_id, game.to_json())
+    games.add(game_id, game)
 
 
 @socketio.on("fetch_state")
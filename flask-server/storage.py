@@ -0,0 +1,166 @@
+import argparse
+import contextlib
+import os
+import queue
+import sqlite3
+import tempfile
+import threading
+import time
+
+DEFAULT_PATH = os.environ.get("GAMES_DB", "games.db")
+# Milliseconds a writer waits for another connection's lock before failing
+BUSY_TIMEOUT = int(os.environ.get("GAMES_DB_BUSY_TIMEOUT", "5000"))
+POOL_SIZE = int(os.environ.get("GAMES_DB_POOL_SIZE", "4"))
+
+CREATE = """
+    CREATE TABLE IF NOT EXISTS games (
+        game_id TEXT PRIMARY KEY,
+        game_data TEXT
+    )
+"""
+SAVE = "INSERT OR REPLACE INTO games (game_id, game_data) VALUES (?, ?)"
+LOAD = "SELECT game_data FROM games WHERE game_id = ?"
+ROWS = "SELECT game_id, game_data FROM games"
+
+
+class Storage:
+    """The games table, through a small pool of long-lived connections.
+
+    Connections run in WAL mode with synchronous=NORMAL, so a commit appends
+    to the log without an fsync and readers never block the writer. sqlite3
+    keeps the prepared SAVE and LOAD statements in each connection's
+    statement cache. A caller borrows a connection for one statement, so the
+    pool stays small however many threads or greenlets serve requests.
+    """
+
+    def __init__(self, path=DEFAULT_PATH, busy_timeout=BUSY_TIMEOUT, size=POOL_SIZE):
+        self.path = path
+        self.busy_timeout = busy_timeout
+        self.size = size
+        self.idle = queue.LifoQueue()
+        self.opened = 0
+        self.lock = threading.Lock()
+
+    def open(self):
+        # Autocommit: each statement is its own transaction. Connections move
+        # between threads but only one uses a connection at a time.
+        conn = sqlite3.connect(
+            self.path,
+            timeout=self.busy_timeout / 1000,
+            isolation_level=None,
+            check_same_thread=False,
+            cached_statements=16,
+        )
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA busy_timeout={int(self.busy_timeout)}")
+        return conn
+
+    @contextlib.contextmanager
+    def connection(self):
+        try:
+            conn = self.idle.get_nowait()
+        except queue.Empty:
+            with self.lock:
+                grow = self.opened < self.size
+                if grow:
+                    self.opened += 1
+            if grow:
+                try:
+                    conn = self.open()
+                except Exception:
+                    with self.lock:
+                        self.opened -= 1
+                    raise
+            else:
+                conn = self.idle.get()
+        try:
+            yield conn
+        finally:
+            self.idle.put(conn)
+
+    def init(self):
+        with self.connection() as conn:
+            conn.execute(CREATE)
+
+    def save(self, game_id, game_data):
+        with self.connection() as conn:
+            conn.execute(SAVE, (game_id, game_data))
+
+    def load(self, game_id):
+        with self.connection() as conn:
+            row = conn.execute(LOAD, (game_id,)).fetchone()
+        return row[0] if row else None
+
+    def rows(self):
+        """Every (game_id, game_data) row."""
+        with self.connection() as conn:
+            return conn.execute(ROWS).fetchall()
+
+    def close(self):
+        """Close the idle connections."""
+        while True:
+            try:
+                conn = self.idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self.lock:
+                self.opened -= 1
+
+
+def connect_per_call_save(path, game_id, game_data):
+    """How server.save_game used to work, for the benchmark."""
+    conn = sqlite3.connect(path)
+    cursor = conn.cursor()
+    cursor.execute(SAVE, (game_id, game_data))
+    conn.commit()
+    conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Game storage benchmark")
+    parser.add_argument("--saves", type=int, default=2000, help="saves per thread")
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--games", type=int, default=50)
+    args = parser.parse_args()
+
+    from OOP_Backgammon import Backgammon
+
+    game_data = Backgammon("White", "Black", "User", "User").to_json()
+
+    def run(save, path):
+        def work(thread):
+            for i in range(args.saves):
+                save(path, f"G{thread}-{i % args.games}", game_data)
+
+        threads = [
+            threading.Thread(target=work, args=(thread,))
+            for thread in range(args.threads)
+        ]
+        began = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return args.saves * args.threads / (time.perf_counter() - began)
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "per_call.db")
+        conn = sqlite3.connect(path)
+        conn.execute(CREATE)
+        conn.close()
+        baseline = run(connect_per_call_save, path)
+
+        storage = Storage(os.path.join(directory, "storage.db"))
+        storage.init()
+        pooled = run(lambda path, game_id, data: storage.save(game_id, data), None)
+        storage.close()
+
+    print(f"{len(game_data)} byte rows, {args.threads} threads x {args.saves} saves")
+    print(f"connect per call: {baseline:.0f} saves/s")
+    print(f"storage: {pooled:.0f} saves/s ({pooled / baseline:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+import argparse
+import contextlib
+import io
+import math
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from search_state import Position
+
+# Engine specs are "name" or "name:key=value,key=value", for example
+# "mcts:iterations=500,rollout_plies=20" or "expectiminimax:plies=1".
+ENGINE_NAMES = ("random", "mcts", "expectiminimax", "race")
+MAX_PLIES = 2000
+
+
+class RandomEngine:
+    """Picks uniformly among the distinct plays."""
+
+    def __init__(self, seed=None):
+        self.random = random.Random(seed)
+
+    def search(self, inital_state):
+        from expectiminimax import Choice
+
+        return Choice(self.random.choice(inital_state.possible_states()), None)
+
+
+def parse_value(text):
+    for kind in (int, float):
+        try:
+            return kind(text)
+        except ValueError:
+            pass
+    return {"true": True, "false": False, "none": None}.get(text.lower(), text)
+
+
+def make_engine(spec, seed=None):
+    """Build the engine for spec. seed seeds the engines that make random
+    choices unless the spec sets one. An MCTS engine keeps its statistics in
+    a table of its own, so one configuration never starts from another's."""
+    name, _, options = spec.partition(":")
+    settings = {}
+    for option in filter(None, options.split(",")):
+        key, _, value = option.partition("=")
+        settings[key] = parse_value(value)
+    if name in ("random", "mcts"):
+        settings.setdefault("seed", seed)
+    if name == "random":
+        return RandomEngine(**settings)
+    if name == "mcts":
+        from MCTS import MCTS
+        from transposition import TranspositionTable
+
+        return MCTS(table=TranspositionTable(), **settings)
+    if name == "expectiminimax":
+        from expectiminimax import Expectiminimax
+
+        return Expectiminimax(**settings)
+    if name == "race":
+        from race import Race
+
+        return Race(**settings)
+    raise ValueError(f"unknown engine {name!r}, expected one of {ENGINE_NAMES}")
+
+
+def play_game(first, second, seed, first_is_white):
+    """Play one game and return (first won, plies, think time and moves for
+    each engine). first won is None for a game stopped at MAX_PLIES."""
+    from OOP_Backgammon import Backgammon
+
+    # Engines are built per game, so every game starts cold. The dice and
+    # each engine draw from their own generators, seeded with independent
+    # draws from seed, so a game with a fixed iteration budget replays exactly
+    # and no two games share a stream.
+    seeds = random.Random(seed)
+    dice = random.Random(seeds.getrandbits(64))
+    engines = [make_engine(spec, seeds.getrandbits(64)) for spec in (first, second)]
+    if not first_is_white:
+        engines.reverse()
+    # The constructor announces who goes first; the engines decide that here
+    with contextlib.redirect_stdout(io.StringIO()):
+        game = Backgammon("White", "Black", "Monte", "Monte")
+    game.real_game = False
+    Position.from_game(game).write_to(game)
+    game.current_turn = dice.randrange(2)
+    think = [0.0, 0.0]
+    moves = [0, 0]
+    plies = 0
+    while not game.check_winner() and plies < MAX_PLIES:
+        roll1, roll2 = dice.randint(1, 6), dice.randint(1, 6)
+        game.rolls = [roll1, roll2] * 2 if roll1 == roll2 else [roll1, roll2]
+        side = game.current_turn
+        began = time.perf_counter()
+        best = engines[side].search(game)
+        think[side] += time.perf_counter() - began
+        moves[side] += 1
+        best.game.write_to(game)
+        game.current_turn = best.game.turn
+        plies += 1
+    winner = best.game.winner()
+    if not first_is_white:
+        think.reverse()
+        moves.reverse()
+        winner = None if winner is None else 1 - winner
+    return None if winner is None else winner == 0, plies, think, moves
+
+
+def wilson_interval(wins, games, z=1.96):
+    """95% Wilson score interval for a win rate."""
+    if not games:
+        return 0.0, 1.0
+    rate = wins / games
+    centre = rate + z * z / (2 * games)
+    spread = z * math.sqrt(rate * (1 - rate) / games + z * z / (4 * games * games))
+    scale = 1 + z * z / games
+    return (centre - spread) / scale, (centre + spread) / scale
+
+
+def main():
+    parser = argparse.ArgumentParser(description="AI-vs-AI tournament")
+    parser.add_argument("first", help="engine spec, e.g. mcts:iterations=1000")
+    parser.add_argument("second", help="engine spec, e.g. random")
+    parser.add_argument("--games", type=int, default=100)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    make_engine(args.first)
+    make_engine(args.second)
+
+    began = time.perf_counter()
+    # Pairs of games share a seed and swap colors
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        results = list(
+            pool.map(
+                play_game,
+                [args.first] * args.games,
+                [args.second] * args.games,
+                [args.seed * 1000003 + game // 2 for game in range(args.games)],
+                [game % 2 == 0 for game in range(args.games)],
+            )
+        )
+    elapsed = time.perf_counter() - began
+
+    # Games stopped at MAX_PLIES have no winner and are left out of the rate
+    wins = sum(won is True for won, plies, think, moves in results)
+    capped = sum(won is None for won, plies, think, moves in results)
+    decided = len(results) - capped
+    low, high = wilson_interval(wins, decided)
+    think = [sum(result[2][side] for result in results) for side in (0, 1)]
+    moves = [sum(result[3][side] for result in results) for side in (0, 1)]
+    plies = sum(result[1] for result in results)
+    print(
+        f"{args.first} vs {args.second}: {len(results)} games, "
+        f"{capped} stopped after {MAX_PLIES} plies"
+    )
+    print(
+        f"{args.first} wins {wins / max(decided, 1):.1%} of decided games "
+        f"(95% CI {low:.1%} to {high:.1%})"
+    )
+    for side, spec in enumerate((args.first, args.second)):
+        print(f"{spec}: {think[side] / max(moves[side], 1) * 1000:.1f} ms per move")
+    print(
+        f"{len(results) / elapsed * 3600:.0f} games/hour, "
+        f"{plies / len(results):.0f} plies per game"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+from collections import OrderedDict
+
+# Each entry costs roughly 200 bytes (an int key, a tuple of two ints and the
+# OrderedDict links), so the default cap keeps the table near 40 MB.
+MAX_ENTRIES = 200000
+
+
+class TranspositionTable:
+    """Position key -> (visits, score), evicting the least recently used."""
+
+    def __init__(self, max_entries=MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        stats = self.entries.get(key)
+        if stats is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return stats
+
+    def store(self, key, visits, score):
+        entries = self.entries
+        entries[key] = (visits, score)
+        entries.move_to_end(key)
+        if len(entries) > self.max_entries:
+            entries.popitem(last=False)
+            self.evictions += 1
+
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def clear(self):
+        self.entries.clear()
+        self.hits = self.misses = self.evictions = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def __str__(self):
+        return (
+            f"{len(self.entries)}/{self.max_entries} entries, "
+            f"hit rate {self.hit_rate():.3f}, {self.evictions} evictions"
+        )